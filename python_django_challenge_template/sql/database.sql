@@ -71,11 +71,15 @@ CREATE TABLE `shopping_cart` (
   `cart_id`     CHAR(32)      NOT NULL,
   `product_id`  INT           NOT NULL,
   `attributes`  VARCHAR(1000) NOT NULL,
+  -- SHA2(attributes, 256): attributes is too long for a MyISAM key.
+  `attributes_hash` CHAR(64)    NOT NULL,
   `quantity`    INT           NOT NULL,
   `buy_now`     BOOL          NOT NULL  DEFAULT true,
   `added_on`    DATETIME      NOT NULL,
   PRIMARY KEY (`item_id`),
-  KEY `idx_shopping_cart_cart_id` (`cart_id`)
+  KEY `idx_shopping_cart_cart_id` (`cart_id`),
+  -- One row per product and attributes in a cart, see shopping cart upserts.
+  UNIQUE KEY `idx_shopping_cart_item` (`cart_id`, `product_id`, `attributes_hash`)
 ) ENGINE=MyISAM;
 
 -- Create orders table
@@ -994,20 +998,21 @@ BEGIN
   FROM   shopping_cart
   WHERE  cart_id = inCartId
          AND product_id = inProductId
-         AND attributes = inAttributes
+         AND attributes_hash = SHA2(inAttributes, 256)
   INTO   productQuantity;
 
   -- Create new shopping cart record, or increase quantity of existing record
   IF productQuantity IS NULL THEN
     INSERT INTO shopping_cart(item_id, cart_id, product_id, attributes,
-                              quantity, added_on)
-           VALUES (UUID(), inCartId, inProductId, inAttributes, 1, NOW());
+                              attributes_hash, quantity, added_on)
+           VALUES (UUID(), inCartId, inProductId, inAttributes,
+                   SHA2(inAttributes, 256), 1, NOW());
   ELSE
     UPDATE shopping_cart
     SET    quantity = quantity + 1, buy_now = true
     WHERE  cart_id = inCartId
            AND product_id = inProductId
-           AND attributes = inAttributes;
+           AND attributes_hash = SHA2(inAttributes, 256);
   END IF;
 END$$
 
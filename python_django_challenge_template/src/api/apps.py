@@ -1,5 +1,27 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class TshopConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from api.cache import NAMESPACE_MODELS, bump_namespace
+
+        for namespace, model_names in NAMESPACE_MODELS.items():
+            receiver = bump_namespace(namespace)
+            for model_name in model_names:
+                model = self.get_model(model_name)
+                for signal in (post_save, post_delete):
+                    signal.connect(receiver, sender=model, weak=False,
+                                   dispatch_uid='catalog_cache_%s_%s' % (namespace, model_name))
+
+        from api.authentication import revoke_inactive_user_tokens
+        from django.contrib.auth.models import User
+
+        for signal in (post_save, post_delete):
+            signal.connect(revoke_inactive_user_tokens, sender=User, dispatch_uid='revoke_user_tokens')
+
+        from api.rendering import prewarm_templates
+
+        prewarm_templates()
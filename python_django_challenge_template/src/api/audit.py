@@ -0,0 +1,207 @@
+import atexit
+import logging
+import threading
+import time
+
+from api.models import Audit
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+AUDIT = getattr(settings, 'AUDIT', {})
+
+# Audit codes of the order lifecycle.
+ORDER_CREATED = 10000
+ORDER_EMAIL_SENT = 10100
+ORDER_EMAIL_FAILED = 10101
+PAYMENT_RECEIVED = 20000
+PAYMENT_FAILED = 20001
+
+
+def audit_row(order_id, message, code):
+    return Audit(order_id=order_id, created_on=timezone.now(), message=message, code=code)
+
+
+class AuditBuffer:
+    """
+    Audit rows waiting to be written, flushed with one `bulk_create` when `max_size` rows
+    are buffered, when the oldest one is `max_age` seconds old, or explicitly with `flush`.
+    Rows that could not be written are kept for the next flush, up to `max_pending` rows.
+    """
+
+    def __init__(self, max_size=100, max_age=5, max_pending=10000):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self.rows = []
+        self.started = None
+        self._lock = threading.Lock()
+
+    def is_due(self):
+        with self._lock:
+            return bool(self.rows) and time.monotonic() - self.started >= self.max_age
+
+    def is_empty(self):
+        with self._lock:
+            return not self.rows
+
+    def add(self, order_id, message, code):
+        with self._lock:
+            if not self.rows:
+                self.started = time.monotonic()
+            self.rows.append(audit_row(order_id, message, code))
+            full = len(self.rows) >= self.max_size or time.monotonic() - self.started >= self.max_age
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self.rows = self.rows, []
+            started = self.started
+        if not rows:
+            return 0
+        try:
+            Audit.objects.bulk_create(rows, batch_size=self.max_size)
+        except Exception:
+            logger.exception("Could not write %s audit rows, keeping them for the next flush", len(rows))
+            self.requeue(rows, started)
+            return 0
+        logger.debug("Wrote %s audit rows", len(rows))
+        return len(rows)
+
+    def requeue(self, rows, started):
+        with self._lock:
+            self.rows[:0] = rows
+            self.started = started
+            dropped = len(self.rows) - self.max_pending
+            if dropped > 0:
+                del self.rows[:dropped]
+        if dropped > 0:
+            logger.error("Dropped the %s oldest unwritten audit rows", dropped)
+
+
+class AuditLog:
+    """
+    One `AuditBuffer` per thread, so each request or worker batch collects its own events.
+    A daemon thread flushes the buffers that are `max_age` seconds old, so the events of a
+    thread that stopped adding any are still written. Every buffer is flushed when the
+    process exits.
+
+    Buffers are held until their thread has ended and they were flushed empty, so rows kept
+    after a failed flush outlive the thread that added them.
+    """
+
+    def __init__(self, max_size=100, max_age=5, max_pending=10000):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self._local = threading.local()
+        # Buffer -> thread that adds to it.
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        atexit.register(self.flush_all)
+
+    @property
+    def buffer(self):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = AuditBuffer(self.max_size, self.max_age, self.max_pending)
+            with self._lock:
+                self._buffers[buffer] = threading.current_thread()
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self.flush_due_forever, name='audit-flusher',
+                                                     daemon=True)
+                    self._flusher.start()
+        return buffer
+
+    def add(self, order_id, message, code):
+        self.buffer.add(order_id, message, code)
+
+    def flush(self):
+        return self.buffer.flush()
+
+    def flush_all(self):
+        return self.flush_buffers(due_only=False)
+
+    def flush_due(self):
+        return self.flush_buffers(due_only=True)
+
+    def flush_buffers(self, due_only):
+        with self._lock:
+            buffers = list(self._buffers.items())
+        written = 0
+        for buffer, thread in buffers:
+            if not due_only or buffer.is_due():
+                written += buffer.flush()
+            # A finished thread adds no more rows: its buffer goes once everything is written.
+            if not thread.is_alive() and buffer.is_empty():
+                with self._lock:
+                    self._buffers.pop(buffer, None)
+        return written
+
+    def flush_due_forever(self):
+        while True:
+            time.sleep(self.max_age)
+            try:
+                self.flush_due()
+            except Exception:
+                logger.exception("Could not flush the audit buffers")
+            finally:
+                # The flusher has its own database connection, do not keep it open.
+                connections.close_all()
+
+
+audit_log = AuditLog(
+    max_size=AUDIT.get('MAX_SIZE', 100),
+    max_age=AUDIT.get('MAX_AGE', 5),
+    max_pending=AUDIT.get('MAX_PENDING', 10000),
+)
+
+
+def audit(order_id, message, code):
+    """
+    Record an event of an order. It is written with the other events of the request or
+    batch, at the latest when it ends.
+    """
+    audit_log.add(order_id, message, code)
+
+
+def flush_audit():
+    return audit_log.flush()
+
+
+def write_audit(events):
+    """
+    Write (order_id, message, code) events now, with one INSERT. Unlike `audit`, errors are
+    raised: workers use it when the work that produced the events can be retried.
+    """
+    rows = [audit_row(order_id, message, code) for order_id, message, code in events]
+    if rows:
+        Audit.objects.bulk_create(rows)
+    return len(rows)
+
+
+def get_audit_trail(order_id):
+    """
+    Audit rows of an order, oldest first, as `orders_get_audit_trail` (uses
+    `idx_audit_order_id`).
+    """
+    return Audit.objects.filter(order_id=order_id).order_by('audit_id')
+
+
+class AuditMiddleware:
+    """
+    Write the audit events of a request once the response is ready.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            flush_audit()
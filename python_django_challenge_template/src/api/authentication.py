@@ -1,25 +1,230 @@
+import hashlib
+import logging
+import threading
+import time
+
+from api.cache import LocalCache
+from api.models import Customer
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete
+from django.utils.functional import cached_property
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+logger = logging.getLogger(__name__)
+
+JWT_TOKEN_USER = getattr(settings, 'JWT_TOKEN_USER', {})
+JWT_TOKEN_CACHE = getattr(settings, 'JWT_TOKEN_CACHE', {})
+
+# `customer_id` of `CustomerTokenMixin.for_user` for users known to have no customer.
+NO_CUSTOMER = object()
+
+
+class CustomerTokenMixin:
+    """
+    Token carrying the `customer_id` and `is_active` claims (access tokens inherit them
+    from their refresh token). Pass `customer_id` when it is already known to save a query,
+    or `NO_CUSTOMER` when the user is known to have none.
+    """
+
+    @classmethod
+    def for_user(cls, user, customer_id=None):
+        token = super().for_user(user)
+        if customer_id is NO_CUSTOMER:
+            customer_id = None
+        elif customer_id is None:
+            customer_id = Customer.objects.filter(user_id=user.pk).values_list('customer_id', flat=True).first()
+        token['customer_id'] = customer_id
+        token['is_active'] = user.is_active
+        return token
+
+
+class CustomerRefreshToken(CustomerTokenMixin, RefreshToken):
+    pass
+
+
+class CustomerAccessToken(CustomerTokenMixin, AccessToken):
+    pass
+
+
+class CustomerTokenUser(TokenUser):
+    """
+    User built from the token claims, without any query. `customer` is loaded on first
+    access, and raises AttributeError like `User.customer` when there is no customer.
+    """
+
+    @cached_property
+    def is_active(self):
+        return self.token.get('is_active', True)
+
+    @cached_property
+    def customer_id(self):
+        return self.token.get('customer_id')
+
+    @cached_property
+    def customer(self):
+        if self.customer_id is None:
+            raise AttributeError('customer')
+        try:
+            return Customer.objects.get(pk=self.customer_id)
+        except Customer.DoesNotExist:
+            raise AttributeError('customer')
+
+
+class RevocationList:
+    """
+    Time from which the tokens of a user are rejected, shared through the Django cache.
+    Each worker keeps what it read for `local_timeout` seconds, so a revocation takes
+    effect after at most that delay and the shared cache is read once per user and period.
+    """
+    prefix = 'jwt:revoked'
+
+    def __init__(self, local_timeout=30, local_max_entries=4096):
+        self.local_timeout = local_timeout
+        self.local = LocalCache(local_max_entries)
+
+    def key(self, user_id):
+        return '%s:%s' % (self.prefix, user_id)
+
+    def revoke(self, user_id):
+        key = self.key(user_id)
+        revoked_at = int(time.time())
+        cache.set(key, revoked_at, int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()))
+        self.local.set(key, revoked_at, self.local_timeout)
+        logger.debug("Tokens of user %s revoked", user_id)
+
+    def revoked_at(self, user_id):
+        key = self.key(user_id)
+        revoked_at = self.local.get(key)
+        if revoked_at is None:
+            revoked_at = cache.get(key) or 0
+            self.local.set(key, revoked_at, self.local_timeout)
+        return revoked_at
+
+    def is_revoked(self, token):
+        issued_at = token.get('iat') or token['exp'] - int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+        return issued_at <= self.revoked_at(token[api_settings.USER_ID_CLAIM])
+
+
+revocation_list = RevocationList(
+    local_timeout=JWT_TOKEN_USER.get('LOCAL_TIMEOUT', 30),
+    local_max_entries=JWT_TOKEN_USER.get('LOCAL_MAX_ENTRIES', 4096),
+)
 
 
-class UserKeyJWTAuthentication(JWTAuthentication):
-  def get_header(self, request):
-    user_key = request.headers.get('USER-KEY')
-    if user_key is None:
-      return None
-    
-    return user_key
-  
-  def authenticate(self, request):
+def revoke_user_tokens(user_id):
+    revocation_list.revoke(user_id)
+
+
+def revoke_inactive_user_tokens(sender, instance, **kwargs):
+    # Token users are not reloaded, deactivated and deleted users must be revoked.
+    if not instance.is_active or kwargs.get('signal') is post_delete:
+        revoke_user_tokens(instance.pk)
+
+
+class TokenCache:
+    """
+    Per-worker LRU of validated tokens keyed on the SHA-256 of the raw token, so a token
+    is decoded and its signature verified once per worker. Entries expire with the token
+    (`exp`), or after `max_timeout` seconds.
+    """
+
+    def __init__(self, max_entries=10000, max_timeout=3600):
+        self.max_timeout = max_timeout
+        self.local = LocalCache(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, raw_token):
+        if isinstance(raw_token, str):
+            raw_token = raw_token.encode('utf-8')
+        return hashlib.sha256(raw_token).hexdigest()
+
+    def get(self, raw_token):
+        token = self.local.get(self.key(raw_token))
+        with self._lock:
+            if token is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return token
+
+    def set(self, raw_token, token):
+        timeout = min(token['exp'] - time.time(), self.max_timeout)
+        if timeout > 0:
+            self.local.set(self.key(raw_token), token, timeout)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.local)}
+
+    def clear(self):
+        self.local.clear()
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+token_cache = TokenCache(
+    max_entries=JWT_TOKEN_CACHE.get('MAX_ENTRIES', 10000),
+    max_timeout=JWT_TOKEN_CACHE.get('TIMEOUT', 3600),
+)
+
+
+class CustomerJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication with an opt-in token-user mode (`JWT_TOKEN_USER['ENABLED']`): tokens
+    issued with `CustomerTokenMixin` authenticate as a `CustomerTokenUser` built from
+    their claims, checked against the revocation list instead of loading `auth_user`.
+
+    Validated tokens are kept in `token_cache` when `JWT_TOKEN_CACHE['ENABLED']` is set.
+    """
+
+    def get_validated_token(self, raw_token):
+        if not JWT_TOKEN_CACHE.get('ENABLED'):
+            return super().get_validated_token(raw_token)
+
+        validated_token = token_cache.get(raw_token)
+        if validated_token is None:
+            validated_token = super().get_validated_token(raw_token)
+            token_cache.set(raw_token, validated_token)
+        return validated_token
+
+    def get_user(self, validated_token):
+        if not JWT_TOKEN_USER.get('ENABLED') or 'customer_id' not in validated_token:
+            return super().get_user(validated_token)
+
+        user = CustomerTokenUser(validated_token)
+        if not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if revocation_list.is_revoked(validated_token):
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return user
+
+
+class UserKeyJWTAuthentication(CustomerJWTAuthentication):
+    def get_header(self, request):
+        user_key = request.headers.get('USER-KEY')
+        if user_key is None:
+            return None
+
+        return user_key
+
+    def authenticate(self, request):
         """
         Override to allow JWTAuthentication to process USER-KEY.
         """
         header = self.get_header(request)
         if header is None:
             return None
-        
+
         raw_token = header.split()[1] if ' ' in header else header
 
         validated_token = self.get_validated_token(raw_token)
         user = self.get_user(validated_token)
 
-        return (user, validated_token)
\ No newline at end of file
+        return (user, validated_token)
@@ -0,0 +1,245 @@
+import functools
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CACHE = getattr(settings, 'CATALOG_CACHE', {})
+
+# Models whose writes invalidate a namespace, connected in `TshopConfig.ready`. Only
+# `save()` and `delete()` send post_save/post_delete: queryset `update()`/`bulk_create()`,
+# raw SQL and stored procedures bypass them and must call `catalog_cache.bump_version()`
+# for the namespace themselves, as must edits made outside Django (e.g. sql/ scripts).
+NAMESPACE_MODELS = {
+    'department': ('Department',),
+    'category': ('Category',),
+    'attribute': ('Attribute', 'AttributeValue'),
+    'tax': ('Tax',),
+    'shipping_region': ('ShippingRegion',),
+    'product': ('Product', 'ProductCategory', 'ProductAttribute'),
+    'review': ('Review',),
+}
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU with per-entry expiry, used in front of the shared cache.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CatalogCache:
+    """
+    Read-through cache for near-static catalog tables.
+
+    Keys are namespaced and carry the namespace version, so bumping the version on writes
+    makes every cached entry of the namespace unreachable. Values live in the local LRU and
+    in the Django cache (memcached in production). Workers re-read a namespace version from
+    the Django cache at most every `VERSION_TIMEOUT` seconds.
+
+    Versions are millisecond timestamps of the last bump, which also makes them usable as
+    `Last-Modified` values.
+    """
+    prefix = 'catalog'
+
+    def __init__(self, local_max_entries=1024, version_timeout=5):
+        self.local = LocalCache(local_max_entries)
+        self.version_timeout = version_timeout
+
+    def version_key(self, namespace):
+        return '%s:%s:version' % (self.prefix, namespace)
+
+    def get_version(self, namespace):
+        key = self.version_key(namespace)
+        version = self.local.get(key)
+        if version is None:
+            version = cache.get(key)
+            if version is None:
+                # A fresh value instead of 1, so an evicted counter never reuses old keys.
+                cache.add(key, now_ms(), None)
+                version = cache.get(key)
+            self.local.set(key, version, self.version_timeout)
+        return version
+
+    def bump_version(self, namespace):
+        key = self.version_key(namespace)
+        version = max(now_ms(), (cache.get(key) or 0) + 1)
+        cache.set(key, version, None)
+        self.local.set(key, version, self.version_timeout)
+        logger.debug("Catalog cache namespace %s is now at version %s", namespace, version)
+        return version
+
+    def make_key(self, namespace, identifier):
+        digest = hashlib.md5(identifier.encode('utf-8')).hexdigest()
+        return '%s:%s:%s:%s' % (self.prefix, namespace, self.get_version(namespace), digest)
+
+    def get(self, key, timeout):
+        value = self.local.get(key)
+        if value is None:
+            value = cache.get(key)
+            if value is not None:
+                self.local.set(key, value, timeout)
+        return value
+
+    def set(self, key, value, timeout):
+        cache.set(key, value, timeout)
+        self.local.set(key, value, timeout)
+
+
+catalog_cache = CatalogCache(
+    local_max_entries=CATALOG_CACHE.get('LOCAL_MAX_ENTRIES', 1024),
+    version_timeout=CATALOG_CACHE.get('VERSION_TIMEOUT', 5),
+)
+
+
+def bump_namespace(namespace):
+    def receiver(sender, **kwargs):
+        catalog_cache.bump_version(namespace)
+    return receiver
+
+
+def cached_action(method):
+    """
+    Serve a `CachedViewSetMixin` action from the catalog cache, keyed on the request path.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        return self.cached_response(request, functools.partial(method, self), *args, **kwargs)
+
+    return wrapper
+
+
+class CachedViewSetMixin:
+    """
+    Serve `list`, `retrieve` and actions decorated with `cached_action` from the catalog
+    cache. Viewsets set `cache_namespace` and may override `cache_timeout` (seconds).
+    """
+    cache_namespace = None
+    cache_timeout = CATALOG_CACHE.get('TIMEOUT', 300)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def cached_response(self, request, view, *args, **kwargs):
+        key = catalog_cache.make_key(self.cache_namespace, request.get_full_path())
+        data = catalog_cache.get(key, self.cache_timeout)
+        if data is not None:
+            return Response(data)
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            catalog_cache.set(key, response.data, self.cache_timeout)
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Answer conditional GET requests from the namespace versions, before any query or
+    serialization runs.
+
+    The ETag hashes the versions of `get_conditional_namespaces()` with the request path and
+    the negotiated format, and the newest version is sent as `Last-Modified`. Matching
+    `If-None-Match`/`If-Modified-Since` headers get a 304. `cache_control` holds the
+    `Cache-Control` directives of the endpoint.
+    """
+    conditional_namespaces = ()
+    cache_control = {'public': True, 'max_age': 60}
+    etag = None
+    last_modified = None
+
+    def get_conditional_namespaces(self):
+        return self.conditional_namespaces
+
+    def get_validators(self, request):
+        namespaces = self.get_conditional_namespaces()
+        if not namespaces:
+            return None, None
+        versions = [catalog_cache.get_version(namespace) for namespace in namespaces]
+        identifier = '%s|%s|%s' % (
+            ','.join('%s=%s' % item for item in zip(namespaces, versions)),
+            request.get_full_path(),
+            request.accepted_renderer.format,
+        )
+        etag = quote_etag(hashlib.md5(identifier.encode('utf-8')).hexdigest())
+        return etag, max(versions) // 1000
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag, self.last_modified = None, None
+        if request.method not in ('GET', 'HEAD'):
+            return
+
+        self.etag, self.last_modified = self.get_validators(request)
+        if self.etag is None:
+            return
+        handler = getattr(self, request.method.lower())
+
+        @functools.wraps(handler)
+        def conditional_handler(request, *args, **kwargs):
+            not_modified = get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+            if not_modified is not None:
+                return not_modified
+            return handler(request, *args, **kwargs)
+
+        setattr(self, request.method.lower(), conditional_handler)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+            if self.etag is not None:
+                response['ETag'] = self.etag
+                response['Last-Modified'] = http_date(self.last_modified)
+            if self.cache_control:
+                patch_cache_control(response, **self.cache_control)
+        return response
@@ -0,0 +1,40 @@
+import re
+
+# 16 ASCII digits, optionally in groups of four separated by dashes. `\d` would also take
+# other Unicode digits, which the digit scan below cannot read.
+CARD_NUMBER = re.compile(r'(?:[0-9]{4}-){3}[0-9]{4}|[0-9]{16}')
+
+# Luhn value of a doubled digit.
+LUHN_DOUBLED = (0, 2, 4, 6, 8, 1, 3, 5, 7, 9)
+
+# A digit repeated this many times in a row is rejected.
+MAX_RUN = 4
+
+
+def validate_credit_card(num):
+    """
+    True when `num` is a well formed card number that passes the Luhn check and repeats no
+    digit `MAX_RUN` times in a row. Both checks are done in one pass over the digits.
+    """
+    if not isinstance(num, str) or not CARD_NUMBER.fullmatch(num):
+        return False
+
+    total = 0
+    double = False
+    previous = None
+    run = 0
+    for char in reversed(num):
+        if char == '-':
+            continue
+        digit = ord(char) - 48
+        if digit == previous:
+            run += 1
+            if run >= MAX_RUN:
+                return False
+        else:
+            previous = digit
+            run = 1
+        total += LUHN_DOUBLED[digit] if double else digit
+        double = not double
+    return total % 10 == 0
+
@@ -0,0 +1,126 @@
+import logging
+from datetime import timedelta
+
+from api.audit import ORDER_EMAIL_FAILED, ORDER_EMAIL_SENT, audit, flush_audit
+from api.models import OrderEmail
+from api.rendering import render_template
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ORDER_EMAIL = getattr(settings, 'ORDER_EMAIL', {})
+
+
+def queue_order_email(order, customer):
+    """
+    Add the confirmation email of an order to the outbox. Delivery happens out of the
+    request path, in the `send_order_emails` command.
+    """
+    return OrderEmail.objects.create(order_id=order.order_id, to_email=customer.email, username=customer.name)
+
+
+def build_order_email(email):
+    context = {
+        'order_id': email.order_id,
+        'username': email.username,
+    }
+    message = EmailMultiAlternatives(
+        subject='%s - Order #%s' % (getattr(settings, 'APP_NAME', 'Turing E-commerce'), email.order_id),
+        body=render_template('notify_order.txt', context),
+        to=[email.to_email],
+    )
+    message.attach_alternative(render_template('notify_order.html', context), 'text/html')
+    return message
+
+
+def claim_order_emails(batch_size, lease, max_attempts):
+    """
+    Return up to `batch_size` due emails, marked as sending for `lease` seconds. Each row
+    is claimed with a conditional UPDATE, so concurrent workers never send the same email
+    twice, and emails left behind by a crashed worker are picked up once the lease expires.
+
+    Claiming counts the attempt, so an email that kills the worker every time still runs out
+    of attempts: one whose lease expired after `max_attempts` claims is left as failed.
+    """
+    now = timezone.now()
+    due = OrderEmail.objects.filter(
+        status__in=(OrderEmail.PENDING, OrderEmail.SENDING),
+        next_attempt_on__lte=now
+    ).order_by('next_attempt_on', 'id').values_list('id', 'order_id', 'status', 'attempts',
+                                                    'next_attempt_on')[:batch_size]
+
+    claimed = []
+    for pk, order_id, status, attempts, next_attempt_on in due:
+        rows = OrderEmail.objects.filter(pk=pk, status=status, next_attempt_on=next_attempt_on)
+        if attempts >= max_attempts:
+            if rows.update(status=OrderEmail.FAILED, last_error='Lease expired'):
+                audit(order_id, 'Confirmation email failed: lease expired', ORDER_EMAIL_FAILED)
+                logger.error("Giving up on the email of order %s after %s attempts: lease expired",
+                             order_id, attempts)
+        elif rows.update(status=OrderEmail.SENDING, attempts=F('attempts') + 1,
+                         next_attempt_on=now + timedelta(seconds=lease)):
+            claimed.append(pk)
+    return list(OrderEmail.objects.filter(pk__in=claimed).order_by('id'))
+
+
+def send_order_emails(batch_size=None, max_attempts=None, retry_delay=None):
+    """
+    Send one batch of due emails over a single connection to the mail server. Failed
+    emails are retried with an exponential delay and are left as failed after
+    `max_attempts`. Returns the number of emails sent.
+    """
+    batch_size = batch_size or ORDER_EMAIL.get('BATCH_SIZE', 50)
+    max_attempts = max_attempts or ORDER_EMAIL.get('MAX_ATTEMPTS', 5)
+    retry_delay = retry_delay or ORDER_EMAIL.get('RETRY_DELAY', 60)
+
+    emails = claim_order_emails(batch_size, ORDER_EMAIL.get('LEASE', 600), max_attempts)
+    if not emails:
+        flush_audit()
+        return 0
+
+    sent = 0
+    connection = get_connection()
+    try:
+        connection.open()
+        for email in emails:
+            try:
+                message = build_order_email(email)
+                message.connection = connection
+                message.send()
+            except Exception as error:
+                fail_order_email(email, error, max_attempts, retry_delay)
+            else:
+                OrderEmail.objects.filter(pk=email.pk).update(status=OrderEmail.SENT, sent_on=timezone.now(),
+                                                              last_error='')
+                audit(email.order_id, 'Confirmation email sent to %s' % email.to_email, ORDER_EMAIL_SENT)
+                sent += 1
+    except Exception as error:
+        # The connection could not be opened: give the whole batch back.
+        for email in emails:
+            fail_order_email(email, error, max_attempts, retry_delay)
+    finally:
+        connection.close()
+        flush_audit()
+
+    logger.debug("Sent %s of %s order emails", sent, len(emails))
+    return sent
+
+
+def fail_order_email(email, error, max_attempts, retry_delay):
+    # The attempt was counted when the email was claimed.
+    attempts = email.attempts
+    if attempts >= max_attempts:
+        status = OrderEmail.FAILED
+        audit(email.order_id, 'Confirmation email failed: %s' % error, ORDER_EMAIL_FAILED)
+        logger.error("Giving up on the email of order %s after %s attempts: %s", email.order_id, attempts, error)
+    else:
+        status = OrderEmail.PENDING
+        logger.warning("Email of order %s failed (attempt %s): %s", email.order_id, attempts, error)
+    OrderEmail.objects.filter(pk=email.pk, status=OrderEmail.SENDING).update(
+        status=status,
+        last_error=str(error)[:255],
+        next_attempt_on=timezone.now() + timedelta(seconds=retry_delay * 2 ** (attempts - 1)),
+    )
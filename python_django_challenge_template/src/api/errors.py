@@ -55,6 +55,12 @@ PRO_01 = Error(code="PRO_01", message="Don't exist product with this ID", _statu
 # Order's Errors
 ORD_01 = Error(code="ORD_01", message="Don't exist order with this ID", _status=404)
 ORD_02 = Error(code="ORD_02", message="Don't exist order detail with this ID", _status=404)
+ORD_03 = Error(code="ORD_03", message="Don't exist shipping with this ID", _status=400, field='shipping_id')
+ORD_04 = Error(code="ORD_04", message="Don't exist tax with this ID", _status=400, field='tax_id')
+ORD_05 = Error(code="ORD_05", message="An order with this Idempotency-Key is being processed", _status=409)
+
+# Stripe's Errors
+STR_01 = Error(code="STR_01", message="Invalid Stripe signature", _status=400)
 
 # Commons Errors
 COM_00 = Error(code="COM_00", message="There is something wrong", _status=500)
@@ -0,0 +1,99 @@
+import logging
+import operator
+import re
+from functools import reduce
+
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import SearchFilter
+
+logger = logging.getLogger(__name__)
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    Search backend that uses the MySQL FULLTEXT index over the view's `search_fields`
+    (`MATCH ... AGAINST`, as in the `catalog_search` procedure) and orders by relevance.
+
+    `all_words=on` runs the search in boolean mode requiring every word; otherwise the
+    natural language mode is used. Databases without FULLTEXT support (SQLite in tests)
+    fall back to the `icontains` lookups of `SearchFilter`.
+
+    Results are ordered by relevance, which the keyset pagination of the view cannot seek
+    on: a search sent with its cursor parameter is rejected.
+    """
+    all_words_param = 'all_words'
+    all_words_description = 'Set to "on" to only return products that contain all the words.'
+
+    # MyISAM ignores words shorter than `ft_min_word_len` (4 by default).
+    min_word_length = 4
+    boolean_operators = re.compile(r'[+\-<>()~*"@]')
+
+    def use_all_words(self, request):
+        return request.query_params.get(self.all_words_param, 'off').lower() in ('on', 'true', '1')
+
+    def use_fulltext(self, search_terms):
+        if connection.vendor != 'mysql':
+            return False
+        return any(len(term) >= self.min_word_length for term in search_terms)
+
+    def get_match_expression(self, queryset, search_fields, all_words):
+        opts = queryset.model._meta
+        quote_name = connection.ops.quote_name
+        columns = ', '.join(
+            '%s.%s' % (quote_name(opts.db_table), quote_name(opts.get_field(field).column))
+            for field in search_fields
+        )
+        return 'MATCH (%s) AGAINST (%%s%s)' % (columns, ' IN BOOLEAN MODE' if all_words else '')
+
+    def get_against(self, search_terms, all_words):
+        if not all_words:
+            return ' '.join(search_terms)
+        terms = (self.boolean_operators.sub('', term) for term in search_terms)
+        return ' '.join('+' + term for term in terms if term)
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+
+        if not search_fields or not search_terms:
+            return queryset
+
+        cursor_param = getattr(getattr(view, 'paginator', None), 'cursor_query_param', None)
+        if cursor_param and cursor_param in request.query_params:
+            raise ValidationError({cursor_param: ['Search results are paginated by page, not by cursor.']})
+
+        all_words = self.use_all_words(request)
+        if not self.use_fulltext(search_terms):
+            return self.filter_fallback(request, queryset, view, search_fields, search_terms, all_words)
+
+        match = self.get_match_expression(queryset, search_fields, all_words)
+        against = self.get_against(search_terms, all_words)
+        return queryset.annotate(
+            relevance=RawSQL(match, (against,), output_field=models.FloatField())
+        ).filter(relevance__gt=0).order_by('-relevance', *queryset.query.order_by)
+
+    def filter_fallback(self, request, queryset, view, search_fields, search_terms, all_words):
+        if all_words:
+            return super().filter_queryset(request, queryset, view)
+
+        orm_lookups = [self.construct_search(str(search_field)) for search_field in search_fields]
+        queries = [
+            models.Q(**{orm_lookup: search_term})
+            for search_term in search_terms
+            for orm_lookup in orm_lookups
+        ]
+        return queryset.filter(reduce(operator.or_, queries))
+
+    def get_schema_fields(self, view):
+        fields = super().get_schema_fields(view)
+        return fields + [
+            coreapi.Field(
+                name=self.all_words_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(title='All words', description=self.all_words_description)
+            )
+        ]
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.auth.hashers import (Argon2PasswordHasher,
+                                         BCryptSHA256PasswordHasher,
+                                         PBKDF2PasswordHasher)
+
+PASSWORD_HASHING = getattr(settings, 'PASSWORD_HASHING', {})
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2 with the costs of PASSWORD_HASHING (needs argon2-cffi).
+    """
+    time_cost = PASSWORD_HASHING.get('ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+    memory_cost = PASSWORD_HASHING.get('ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+    parallelism = PASSWORD_HASHING.get('ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
+
+
+class TunedBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+    """
+    BCrypt with the rounds of PASSWORD_HASHING (needs bcrypt).
+    """
+    rounds = PASSWORD_HASHING.get('BCRYPT_ROUNDS', BCryptSHA256PasswordHasher.rounds)
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 with the iterations of PASSWORD_HASHING.
+    """
+    iterations = PASSWORD_HASHING.get('PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
@@ -0,0 +1,58 @@
+import time
+
+from api import authentication
+from api.authentication import CustomerRefreshToken, UserKeyJWTAuthentication
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+
+
+class Command(BaseCommand):
+    help = 'Measure the authentication overhead per request, with and without the token cache and token-user mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='Requests to authenticate.')
+        parser.add_argument('--user-id', type=int, help='User to authenticate as. Default: the first user.')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user_id']:
+            users = users.filter(pk=options['user_id'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No user to authenticate as')
+
+        token = str(CustomerRefreshToken.for_user(user).access_token)
+        request = RequestFactory().get('/customer', HTTP_USER_KEY='Bearer %s' % token)
+
+        for token_cache, token_user in ((False, False), (True, False), (True, True)):
+            self.run(request, options['count'], token_cache, token_user)
+
+    def run(self, request, count, token_cache, token_user):
+        previous = (authentication.JWT_TOKEN_CACHE.get('ENABLED'), authentication.JWT_TOKEN_USER.get('ENABLED'))
+        authentication.JWT_TOKEN_CACHE['ENABLED'] = token_cache
+        authentication.JWT_TOKEN_USER['ENABLED'] = token_user
+        authentication.token_cache.clear()
+        auth = UserKeyJWTAuthentication()
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        try:
+            with connection.execute_wrapper(count_queries):
+                start = time.perf_counter()
+                for _ in range(count):
+                    user, _ = auth.authenticate(request)
+                    getattr(user, 'customer', None)
+                elapsed = time.perf_counter() - start
+        finally:
+            authentication.JWT_TOKEN_CACHE['ENABLED'], authentication.JWT_TOKEN_USER['ENABLED'] = previous
+
+        self.stdout.write('Token cache %s, token user %s: %.1fus and %.1f queries per request (user and customer)' % (
+            'on' if token_cache else 'off', 'on' if token_user else 'off',
+            elapsed * 1000000 / count, len(queries) / count))
+        if token_cache:
+            self.stdout.write('  token cache: %(hits)s hits, %(misses)s misses' % authentication.token_cache.stats())
@@ -0,0 +1,71 @@
+import time
+import uuid
+
+from api.models import Product, ShoppingCart
+from api.viewsets.shoppingcart import attributes_hash, get_products, total_amount
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone
+
+
+def naive_total_amount(cart_id):
+    """
+    Total computed row by row, with a product query per item.
+    """
+    total = 0
+    for item in ShoppingCart.objects.filter(cart_id=cart_id, buy_now=True):
+        product = Product.objects.get(product_id=item.product_id)
+        total += (product.discounted_price or product.price) * item.quantity
+    return total
+
+
+class Command(BaseCommand):
+    help = 'Read carts of 1, 50 and 500 items and report the latency and queries of the cart endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100, help='Reads per cart and endpoint.')
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 50, 500], help='Items per cart.')
+
+    def handle(self, *args, **options):
+        count, sizes = options['count'], options['sizes']
+        factory = RequestFactory()
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        # Temporary products and carts, deleted when the run ends.
+        now = timezone.now()
+        products = [Product.objects.create(name='Benchmark %s' % index, description='Benchmark', price=10 + index,
+                                           discounted_price=index % 2 * 5, display=0)
+                    for index in range(max(sizes))]
+        carts = {}
+        try:
+            for size in sizes:
+                cart_id = uuid.uuid4().hex
+                ShoppingCart.objects.bulk_create([
+                    ShoppingCart(cart_id=cart_id, product=product, attributes='Benchmark',
+                                 attributes_hash=attributes_hash('Benchmark'), quantity=2, buy_now=True, added_on=now)
+                    for product in products[:size]
+                ])
+                carts[size] = cart_id
+
+            for size, cart_id in carts.items():
+                for name, run in (
+                        ('get_products', lambda: get_products(factory.get('/shoppingcart/%s' % cart_id), cart_id)),
+                        ('total_amount', lambda: total_amount(factory.get('/shoppingcart/totalAmount/%s' % cart_id),
+                                                              cart_id)),
+                        ('naive total', lambda: naive_total_amount(cart_id))):
+                    del queries[:]
+                    with connection.execute_wrapper(count_queries):
+                        start = time.perf_counter()
+                        for _ in range(count):
+                            run()
+                        elapsed = time.perf_counter() - start
+                    self.stdout.write('%s items, %s: %.3fms each, %.1f queries each' % (
+                        size, name, elapsed * 1000 / count, len(queries) / count))
+        finally:
+            ShoppingCart.objects.filter(cart_id__in=carts.values()).delete()
+            Product.objects.filter(product_id__in=[product.product_id for product in products]).delete()
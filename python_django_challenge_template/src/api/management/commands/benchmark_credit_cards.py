@@ -0,0 +1,53 @@
+import random
+import re
+import time
+from itertools import groupby
+
+from api.credit_cards import LUHN_DOUBLED, validate_credit_card
+from django.core.management.base import BaseCommand
+
+
+def legacy_validate_credit_card(num):
+    """
+    Validation as it was in api/viewsets/customers.py, without the Luhn check.
+    """
+    pattern = re.compile(r'(?:\d{4}-){3}\d{4}|\d{16}')
+    return bool(pattern.fullmatch(num)) and max(len(list(g)) for _, g in groupby(num.replace('-', ''))) < 4
+
+
+def card_number(rng):
+    """
+    A random 16 digit number with a valid Luhn check digit, dashed half of the time.
+    """
+    digits = [rng.randrange(10) for _ in range(15)]
+    total = sum(LUHN_DOUBLED[digit] if index % 2 == 0 else digit
+                for index, digit in enumerate(reversed(digits)))
+    number = ''.join(map(str, digits)) + str(-total % 10)
+    if rng.random() < 0.5:
+        number = '-'.join(number[index:index + 4] for index in range(0, 16, 4))
+    return number
+
+
+class Command(BaseCommand):
+    help = 'Compare the credit card validation with the previous implementation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000, help='Card numbers to validate.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the generated numbers.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        count = options['count']
+        numbers = [card_number(rng) for _ in range(count)]
+        # A quarter of malformed or mistyped numbers.
+        for index in range(0, count, 4):
+            numbers[index] = numbers[index][:-1] + str((int(numbers[index][-1]) + 1) % 10)
+
+        for name, run in (
+                ('legacy', lambda: [legacy_validate_credit_card(num) for num in numbers]),
+                ('validate_credit_card', lambda: [validate_credit_card(num) for num in numbers])):
+            start = time.perf_counter()
+            valid = run()
+            elapsed = time.perf_counter() - start
+            self.stdout.write('%s: %.0f numbers/s, %.2fus each, %s valid' % (
+                name, count / elapsed, elapsed * 1000000 / count, sum(valid)))
@@ -0,0 +1,45 @@
+import time
+
+from api.viewsets.customers import token_obtain_pair
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIRequestFactory
+
+
+class Command(BaseCommand):
+    help = 'Measure the throughput of the login endpoint for an existing customer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Email of the customer.')
+        parser.add_argument('password', help='Password of the customer.')
+        parser.add_argument('--count', type=int, default=100, help='Logins to run.')
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        latencies = []
+        with connection.execute_wrapper(count_queries):
+            for _ in range(options['count']):
+                request = factory.post('/customers/login', {
+                    'username': options['email'],
+                    'password': options['password'],
+                }, format='json')
+                start = time.perf_counter()
+                response = token_obtain_pair(request)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise CommandError('Login failed: %s' % response.data)
+
+        total = sum(latencies)
+        latencies.sort()
+        self.stdout.write('%s logins in %.2fs (%.1f logins/s), p50 %.1fms, p99 %.1fms, %.1f queries per login' % (
+            len(latencies), total, len(latencies) / total,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+            len(queries) / len(latencies),
+        ))
@@ -0,0 +1,30 @@
+import time
+
+from api.emails import build_order_email
+from api.models import OrderEmail
+from api.rendering import render_stats
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Render order confirmation emails in memory and report the throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='Emails to render.')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        render_stats.reset()
+
+        start = time.perf_counter()
+        for index in range(count):
+            email = OrderEmail(order_id=index + 1, to_email='customer%s@example.com' % index,
+                               username='Customer %s' % index)
+            build_order_email(email).message()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write('Built %s emails in %.2fs (%.0f emails/s, %.3fms each)' % (
+            count, elapsed, count / elapsed, elapsed * 1000 / count))
+        for name, stats in render_stats.snapshot().items():
+            self.stdout.write('%s: %s renders, mean %.3fms, max %.3fms' % (
+                name, stats['count'], stats['mean'] * 1000, stats['max'] * 1000))
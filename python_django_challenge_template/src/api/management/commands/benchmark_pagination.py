@@ -0,0 +1,63 @@
+import time
+import uuid
+from base64 import b64encode
+
+from api.models import Product
+from api.viewsets.products import ProductViewSet
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+
+
+class Command(BaseCommand):
+    help = 'Compare the latency of the first and a deep page of /products in offset and keyset mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=50, help='Requests per page and mode.')
+        parser.add_argument('--page', type=int, default=1000, help='Deep page to compare with page 1.')
+        parser.add_argument('--limit', type=int, default=20, help='Products per page.')
+
+    def handle(self, *args, **options):
+        count, page, limit = options['count'], options['page'], options['limit']
+        view = ProductViewSet.as_view({'get': 'list'})
+        factory = RequestFactory()
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        # Temporary products fill the table up to the deep page, deleted when the run ends.
+        marker = 'Benchmark %s' % uuid.uuid4().hex
+        missing = page * limit - Product.objects.count()
+        Product.objects.bulk_create([
+            Product(name='Benchmark %s' % index, description=marker, price=10, discounted_price=0, display=0)
+            for index in range(max(missing, 0))
+        ], batch_size=500)
+        try:
+            # Keyset pages start after the last product of the previous page.
+            cursor = ''
+            if page > 1:
+                last_seen = Product.objects.order_by('product_id').values_list('product_id', flat=True)[
+                    (page - 1) * limit - 1]
+                cursor = b64encode(str(last_seen).encode('ascii')).decode('ascii')
+
+            for name, params in (
+                    ('offset page 1', {'page': 1}),
+                    ('offset page %s' % page, {'page': page}),
+                    ('keyset page 1', {'cursor': ''}),
+                    ('keyset page %s' % page, {'cursor': cursor})):
+                params['limit'] = limit
+                del queries[:]
+                with connection.execute_wrapper(count_queries):
+                    start = time.perf_counter()
+                    for _ in range(count):
+                        response = view(factory.get('/products/', params))
+                        if response.status_code != 200 or len(response.data['rows']) != limit:
+                            self.stderr.write('%s failed: %s' % (name, response.status_code))
+                            return
+                    elapsed = time.perf_counter() - start
+                self.stdout.write('%s: %.3fms each, %.1f queries each' % (
+                    name, elapsed * 1000 / count, len(queries) / count))
+        finally:
+            Product.objects.filter(description=marker).delete()
@@ -0,0 +1,50 @@
+import time
+
+from api.hashers import (TunedArgon2PasswordHasher,
+                         TunedBCryptSHA256PasswordHasher,
+                         TunedPBKDF2PasswordHasher)
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Measure the latency of hashing and checking a password with each hashing profile'
+
+    hashers = (
+        ('argon2', TunedArgon2PasswordHasher),
+        ('bcrypt', TunedBCryptSHA256PasswordHasher),
+        ('pbkdf2', TunedPBKDF2PasswordHasher),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=50, help='Passwords hashed per profile.')
+
+    def handle(self, *args, **options):
+        for profile, hasher_class in self.hashers:
+            hasher = hasher_class()
+            try:
+                if hasher.library:
+                    hasher._load_library()
+            except ValueError as error:
+                self.stdout.write('%s: skipped (%s)' % (profile, error))
+                continue
+            self.run(profile, hasher, options['count'])
+
+    def run(self, profile, hasher, count):
+        encode, verify = [], []
+        for index in range(count):
+            password = 'campaign-signup-%s' % index
+            start = time.perf_counter()
+            encoded = hasher.encode(password, hasher.salt())
+            encode.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            hasher.verify(password, encoded)
+            verify.append(time.perf_counter() - start)
+
+        for name, latencies in (('hash', encode), ('check', verify)):
+            latencies.sort()
+            self.stdout.write('%s %s: p50 %.1fms, p99 %.1fms, max %.1fms' % (
+                profile, name,
+                latencies[len(latencies) // 2] * 1000,
+                latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+                latencies[-1] * 1000,
+            ))
@@ -0,0 +1,67 @@
+import time
+
+from api.social import StubFacebookOAuth2
+from api.viewsets.customers import SocialLoginView
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from social_core.backends.utils import load_backends
+from social_django.models import UserSocialAuth
+
+
+class Command(BaseCommand):
+    help = 'Log in through the social login view against a stubbed provider and report the cost per login'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000, help='Logins to run.')
+        parser.add_argument('--users', type=int, default=100,
+                            help='Distinct access tokens, logins beyond this repeat a token.')
+        parser.add_argument('--latency', type=float, default=0,
+                            help='Milliseconds spent on every provider profile request.')
+
+    def handle(self, *args, **options):
+        count, users = options['count'], options['users']
+        StubFacebookOAuth2.latency = options['latency'] / 1000
+        StubFacebookOAuth2.requests = 0
+        view = SocialLoginView.as_view(provider=StubFacebookOAuth2.name)
+        factory = RequestFactory()
+        sessions = SessionMiddleware()
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        backends = settings.AUTHENTICATION_BACKENDS + ('api.social.StubFacebookOAuth2',)
+        # social_django reads AUTHENTICATION_BACKENDS once, register the stub in its cache.
+        load_backends(backends, force_load=True)
+        # Tokens are unique to this run, the first login of each one is a cache miss.
+        run = int(time.time())
+        tokens = ['stub-%s%s' % (run, index) for index in range(min(users, count))]
+        try:
+            with override_settings(AUTHENTICATION_BACKENDS=backends), connection.execute_wrapper(count_queries):
+                start = time.perf_counter()
+                for index in range(count):
+                    request = factory.post('/customers/facebook', {
+                        'access_token': tokens[index % users]
+                    }, content_type='application/json')
+                    sessions.process_request(request)
+                    response = view(request)
+                    if response.status_code != 200:
+                        self.stderr.write('Login failed: %s' % response.data)
+                        return
+                elapsed = time.perf_counter() - start
+
+            self.stdout.write('%s logins in %.2fs (%.2fms each)' % (count, elapsed, elapsed * 1000 / count))
+            self.stdout.write('%.2f provider requests and %.1f queries per login' % (
+                StubFacebookOAuth2.requests / count, len(queries) / count))
+        finally:
+            cache.delete_many([StubFacebookOAuth2(None).profile_key(token) for token in tokens])
+            # The users of this run, their customers and social accounts go with them.
+            User.objects.filter(pk__in=UserSocialAuth.objects.filter(
+                provider=StubFacebookOAuth2.name, uid__in=[token.rpartition('-')[2] for token in tokens]
+            ).values('user_id')).delete()
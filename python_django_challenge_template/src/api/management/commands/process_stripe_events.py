@@ -0,0 +1,25 @@
+import time
+
+from api.webhooks import process_stripe_events
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Apply the received Stripe webhook events to the orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.WEBHOOK.get('batch_size', 200),
+                            help='Events applied per batch.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new events.')
+        parser.add_argument('--interval', type=float, default=1, help='Seconds between polls with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            handled = process_stripe_events(batch_size=options['batch_size'])
+            if handled:
+                self.stdout.write('Handled %s Stripe events' % handled)
+            elif options['loop']:
+                time.sleep(options['interval'])
+            else:
+                break
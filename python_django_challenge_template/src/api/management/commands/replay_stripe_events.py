@@ -0,0 +1,72 @@
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import stripe
+from api.models import StripeEvent
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Send recorded Stripe events to the webhook endpoint, signed like Stripe does, for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help='JSON files with one event, a list of events or one event per line.')
+        parser.add_argument('--from-db', action='store_true', help='Replay the events stored in stripe_event.')
+        parser.add_argument('--url', default='http://localhost:8000/stripe/webhooks', help='Webhook endpoint.')
+        parser.add_argument('--secret', default=settings.WEBHOOK.get('secret'), help='Webhook signing secret.')
+        parser.add_argument('--repeat', type=int, default=1, help='Deliveries of each event, to exercise deduplication.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Parallel deliveries.')
+
+    def handle(self, *args, **options):
+        if not options['secret']:
+            raise CommandError('No webhook secret: set STRIPE_WEBHOOK_SECRET or use --secret')
+
+        payloads = list(self.load_payloads(options['files']))
+        if options['from_db']:
+            payloads += list(StripeEvent.objects.order_by('id').values_list('payload', flat=True))
+        if not payloads:
+            raise CommandError('No events to replay')
+        payloads = [payload for payload in payloads for _ in range(options['repeat'])]
+
+        session = requests.Session()
+        session.mount('http', requests.adapters.HTTPAdapter(pool_maxsize=options['concurrency']))
+
+        def deliver(payload):
+            timestamp = int(time.time())
+            signature = stripe.WebhookSignature._compute_signature('%d.%s' % (timestamp, payload), options['secret'])
+            start = time.perf_counter()
+            response = session.post(options['url'], data=payload.encode('utf-8'), headers={
+                'Content-Type': 'application/json',
+                'Stripe-Signature': 't=%d,v1=%s' % (timestamp, signature),
+            })
+            return response.status_code, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(deliver, payloads))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for _, latency in results)
+        self.stdout.write('Sent %s deliveries in %.2fs (%.0f/s)' % (len(results), elapsed, len(results) / elapsed))
+        self.stdout.write('Latency p50 %.1fms, p95 %.1fms, max %.1fms' % (
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.95)] * 1000,
+            latencies[-1] * 1000,
+        ))
+        for status, count in sorted(Counter(status for status, _ in results).items()):
+            self.stdout.write('HTTP %s: %s' % (status, count))
+
+    def load_payloads(self, files):
+        for path in files:
+            with open(path) as f:
+                content = f.read().strip()
+            try:
+                data = json.loads(content)
+            except ValueError:
+                data = [json.loads(line) for line in content.splitlines() if line.strip()]
+            for event in (data if isinstance(data, list) else [data]):
+                yield json.dumps(event)
@@ -0,0 +1,32 @@
+import time
+
+from api.emails import send_order_emails
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Send the pending order confirmation emails of the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Emails sent per connection.')
+        parser.add_argument('--max-attempts', type=int, help='Attempts before an email is left as failed.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = self.send_pending(options['batch_size'], options['max_attempts'])
+            if not options['loop']:
+                break
+            if not sent:
+                time.sleep(options['interval'])
+
+    def send_pending(self, batch_size, max_attempts):
+        total = 0
+        while True:
+            sent = send_order_emails(batch_size=batch_size, max_attempts=max_attempts)
+            if not sent:
+                break
+            total += sent
+            self.stdout.write('Sent %s order emails' % sent)
+        return total
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.2 on 2026-10-18 11:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_orderrequest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to_email', models.CharField(max_length=100)),
+                ('username', models.CharField(max_length=50)),
+                ('status', models.SmallIntegerField(choices=[(0, 'Pending'), (1, 'Sending'), (2, 'Sent'), (3, 'Failed')], default=0)),
+                ('attempts', models.SmallIntegerField(default=0)),
+                ('last_error', models.CharField(blank=True, max_length=255)),
+                ('next_attempt_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('sent_on', models.DateTimeField(blank=True, null=True)),
+                ('order', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='emails', to='api.Orders')),
+            ],
+            options={
+                'db_table': 'order_email',
+                'index_together': {('status', 'next_attempt_on')},
+            },
+        ),
+    ]
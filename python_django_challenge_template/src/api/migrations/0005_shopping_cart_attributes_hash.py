@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# shopping_cart is created by sql/database.sql, databases loaded from an older copy get
+# the attributes_hash column and the unique key of the cart upserts here.
+MERGE_DUPLICATES = """
+UPDATE shopping_cart s
+JOIN (SELECT MIN(item_id) AS item_id, SUM(quantity) AS quantity, MAX(buy_now) AS buy_now
+      FROM shopping_cart
+      GROUP BY cart_id, product_id, attributes_hash
+      HAVING COUNT(*) > 1) d ON d.item_id = s.item_id
+SET s.quantity = d.quantity, s.buy_now = d.buy_now
+"""
+
+DELETE_DUPLICATES = """
+DELETE s FROM shopping_cart s
+JOIN shopping_cart k ON k.cart_id = s.cart_id AND k.product_id = s.product_id
+                        AND k.attributes_hash = s.attributes_hash AND k.item_id < s.item_id
+"""
+
+
+def add_attributes_hash(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'mysql':
+        return
+
+    with connection.cursor() as cursor:
+        if 'shopping_cart' not in connection.introspection.table_names(cursor):
+            return
+        columns = [column.name for column in connection.introspection.get_table_description(cursor, 'shopping_cart')]
+        if 'attributes_hash' not in columns:
+            cursor.execute("ALTER TABLE shopping_cart ADD COLUMN attributes_hash CHAR(64) NOT NULL DEFAULT '' "
+                           "AFTER attributes")
+        cursor.execute("UPDATE shopping_cart SET attributes_hash = SHA2(attributes, 256) WHERE attributes_hash = ''")
+
+        constraints = connection.introspection.get_constraints(cursor, 'shopping_cart')
+        if constraints.get('idx_shopping_cart_item', {}).get('columns') == ['cart_id', 'product_id', 'attributes_hash']:
+            return
+        # Rows of the same product and attributes are merged into the oldest one.
+        cursor.execute(MERGE_DUPLICATES)
+        cursor.execute(DELETE_DUPLICATES)
+        if 'idx_shopping_cart_item' in constraints:
+            cursor.execute("ALTER TABLE shopping_cart DROP INDEX idx_shopping_cart_item")
+        cursor.execute("ALTER TABLE shopping_cart "
+                       "ADD UNIQUE KEY idx_shopping_cart_item (cart_id, product_id, attributes_hash)")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_stripeevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_attributes_hash, migrations.RunPython.noop),
+    ]
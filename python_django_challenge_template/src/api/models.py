@@ -7,6 +7,7 @@
 # Feel free to rename the models, but don't rename db_table values or field names.
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 
 class Attribute(models.Model):
@@ -20,7 +21,7 @@ class Attribute(models.Model):
 
 class AttributeValue(models.Model):
     attribute_value_id = models.AutoField(primary_key=True)
-    attribute_id = models.IntegerField()
+    attribute = models.ForeignKey('Attribute', models.DO_NOTHING, db_constraint=False, related_name='values')
     value = models.CharField(max_length=100)
 
     class Meta:
@@ -30,7 +31,7 @@ class AttributeValue(models.Model):
 
 class Audit(models.Model):
     audit_id = models.AutoField(primary_key=True)
-    order_id = models.IntegerField()
+    order = models.ForeignKey('Orders', models.DO_NOTHING, db_constraint=False, related_name='audits')
     created_on = models.DateTimeField()
     message = models.TextField()
     code = models.IntegerField()
@@ -42,7 +43,7 @@ class Audit(models.Model):
 
 class Category(models.Model):
     category_id = models.AutoField(primary_key=True)
-    department_id = models.IntegerField()
+    department = models.ForeignKey('Department', models.DO_NOTHING, db_constraint=False, related_name='categories')
     name = models.CharField(max_length=100)
     description = models.CharField(max_length=1000, blank=True, null=True)
 
@@ -88,8 +89,8 @@ class Department(models.Model):
 
 class OrderDetail(models.Model):
     item_id = models.AutoField(primary_key=True)
-    order_id = models.IntegerField()
-    product_id = models.IntegerField()
+    order = models.ForeignKey('Orders', models.DO_NOTHING, db_constraint=False, related_name='details')
+    product = models.ForeignKey('Product', models.DO_NOTHING, db_constraint=False, related_name='+')
     attributes = models.CharField(max_length=1000)
     product_name = models.CharField(max_length=100)
     quantity = models.IntegerField()
@@ -107,17 +108,59 @@ class Orders(models.Model):
     shipped_on = models.DateTimeField(blank=True, null=True)
     status = models.IntegerField()
     comments = models.CharField(max_length=255, blank=True, null=True)
-    customer_id = models.IntegerField(blank=True, null=True)
+    customer = models.ForeignKey('Customer', models.DO_NOTHING, db_constraint=False, blank=True, null=True,
+                                 related_name='orders')
     auth_code = models.CharField(max_length=50, blank=True, null=True)
     reference = models.CharField(max_length=50, blank=True, null=True)
-    shipping_id = models.IntegerField(blank=True, null=True)
-    tax_id = models.IntegerField(blank=True, null=True)
+    shipping = models.ForeignKey('Shipping', models.DO_NOTHING, db_constraint=False, blank=True, null=True,
+                                 related_name='+')
+    tax = models.ForeignKey('Tax', models.DO_NOTHING, db_constraint=False, blank=True, null=True, related_name='+')
 
     class Meta:
         managed = False
         db_table = 'orders'
 
 
+class OrderEmail(models.Model):
+    # Outbox of order confirmation emails, delivered by the send_order_emails command.
+    PENDING = 0
+    SENDING = 1
+    SENT = 2
+    FAILED = 3
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    order = models.ForeignKey('Orders', models.DO_NOTHING, db_constraint=False, related_name='emails')
+    to_email = models.CharField(max_length=100)
+    username = models.CharField(max_length=50)
+    status = models.SmallIntegerField(choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.SmallIntegerField(default=0)
+    last_error = models.CharField(max_length=255, blank=True)
+    next_attempt_on = models.DateTimeField(default=timezone.now)
+    created_on = models.DateTimeField(auto_now_add=True)
+    sent_on = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'order_email'
+        index_together = (('status', 'next_attempt_on'),)
+
+
+class OrderRequest(models.Model):
+    # Idempotency keys of checkout requests, see create_order.
+    customer = models.ForeignKey('Customer', models.DO_NOTHING, db_constraint=False)
+    key = models.CharField(max_length=64)
+    order = models.ForeignKey('Orders', models.DO_NOTHING, db_constraint=False, blank=True, null=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'order_request'
+        unique_together = (('customer', 'key'),)
+
+
 class Product(models.Model):
     product_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100)
@@ -128,6 +171,8 @@ class Product(models.Model):
     image_2 = models.CharField(max_length=150, blank=True, null=True)
     thumbnail = models.CharField(max_length=150, blank=True, null=True)
     display = models.SmallIntegerField()
+    categories = models.ManyToManyField('Category', through='ProductCategory', related_name='products')
+    attribute_values = models.ManyToManyField('AttributeValue', through='ProductAttribute', related_name='products')
 
     class Meta:
         managed = False
@@ -135,29 +180,31 @@ class Product(models.Model):
 
 
 class ProductAttribute(models.Model):
-    product_id = models.IntegerField(primary_key=True)
-    attribute_value_id = models.IntegerField()
+    # The table has a composite primary key, Django only sees its first column.
+    product = models.ForeignKey('Product', models.DO_NOTHING, primary_key=True, db_constraint=False)
+    attribute_value = models.ForeignKey('AttributeValue', models.DO_NOTHING, db_constraint=False)
 
     class Meta:
         managed = False
         db_table = 'product_attribute'
-        unique_together = (('product_id', 'attribute_value_id'),)
+        unique_together = (('product', 'attribute_value'),)
 
 
 class ProductCategory(models.Model):
-    product_id = models.IntegerField(primary_key=True)
-    category_id = models.IntegerField()
+    # The table has a composite primary key, Django only sees its first column.
+    product = models.ForeignKey('Product', models.DO_NOTHING, primary_key=True, db_constraint=False)
+    category = models.ForeignKey('Category', models.DO_NOTHING, db_constraint=False)
 
     class Meta:
         managed = False
         db_table = 'product_category'
-        unique_together = (('product_id', 'category_id'),)
+        unique_together = (('product', 'category'),)
 
 
 class Review(models.Model):
     review_id = models.AutoField(primary_key=True)
-    customer_id = models.IntegerField()
-    product_id = models.IntegerField()
+    customer = models.ForeignKey('Customer', models.DO_NOTHING, db_constraint=False, related_name='reviews')
+    product = models.ForeignKey('Product', models.DO_NOTHING, db_constraint=False, related_name='reviews')
     review = models.TextField()
     rating = models.SmallIntegerField()
     created_on = models.DateTimeField()
@@ -171,7 +218,8 @@ class Shipping(models.Model):
     shipping_id = models.AutoField(primary_key=True)
     shipping_type = models.CharField(max_length=100)
     shipping_cost = models.DecimalField(max_digits=10, decimal_places=2)
-    shipping_region_id = models.IntegerField()
+    shipping_region = models.ForeignKey('ShippingRegion', models.DO_NOTHING, db_constraint=False,
+                                        related_name='shippings')
 
     class Meta:
         managed = False
@@ -190,8 +238,10 @@ class ShippingRegion(models.Model):
 class ShoppingCart(models.Model):
     item_id = models.AutoField(primary_key=True)
     cart_id = models.CharField(max_length=32)
-    product_id = models.IntegerField()
+    product = models.ForeignKey('Product', models.DO_NOTHING, db_constraint=False, related_name='+')
     attributes = models.CharField(max_length=1000)
+    # SHA-256 of attributes, which is too long to be part of the MyISAM unique key.
+    attributes_hash = models.CharField(max_length=64)
     quantity = models.IntegerField()
     buy_now = models.IntegerField()
     added_on = models.DateTimeField()
@@ -199,6 +249,34 @@ class ShoppingCart(models.Model):
     class Meta:
         managed = False
         db_table = 'shopping_cart'
+        unique_together = (('cart_id', 'product', 'attributes_hash'),)
+
+
+class StripeEvent(models.Model):
+    # Raw Stripe webhook events, unique per event id, processed by process_stripe_events.
+    PENDING = 0
+    PROCESSING = 1
+    PROCESSED = 2
+    FAILED = 3
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (PROCESSED, 'Processed'),
+        (FAILED, 'Failed'),
+    )
+
+    event_id = models.CharField(unique=True, max_length=255)
+    type = models.CharField(max_length=100)
+    payload = models.TextField()
+    status = models.SmallIntegerField(choices=STATUS_CHOICES, default=PENDING)
+    last_error = models.CharField(max_length=255, blank=True)
+    received_on = models.DateTimeField(auto_now_add=True)
+    next_attempt_on = models.DateTimeField(default=timezone.now)
+    processed_on = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'stripe_event'
+        index_together = (('status', 'next_attempt_on'),)
 
 
 class Tax(models.Model):
@@ -209,13 +287,3 @@ class Tax(models.Model):
     class Meta:
         managed = False
         db_table = 'tax'
-
-class Category(models.Model):
-    category_id = models.AutoField(primary_key=True)
-    department_id = models.IntegerField()
-    name = models.CharField(max_length=100)
-    description = models.CharField(max_length=1000, blank=True, null=True)
-
-    class Meta:
-        managed = False
-        db_table = 'category'
@@ -0,0 +1,117 @@
+from base64 import b64decode, b64encode
+
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class ProductSetPagination(PageNumberPagination):
+    page_size = 20
+    page_query_description = 'Inform the page. Starting with 1. Default: 1'
+    page_size_query_param = 'limit'
+    page_size_query_description = 'Limit per page, Default: 20.'
+    max_page_size = 200
+
+    # Keyset (seek) mode, enabled by sending the cursor parameter (empty for the first page).
+    # Pages are fetched with `WHERE <ordering> > last_seen ORDER BY <ordering> LIMIT n`, so
+    # deep pages cost the same as the first one and no COUNT(*) runs unless requested.
+    # `ordering` is a single unique integer column, optionally prefixed with '-'.
+    ordering = 'product_id'
+    cursor_query_param = 'cursor'
+    cursor_query_description = 'Opaque cursor returned in `next`. Send it empty to start keyset pagination.'
+    count_query_param = 'count'
+    count_query_description = 'Keyset mode only: set to true to include the total count.'
+    invalid_cursor_message = 'Invalid cursor'
+    # Use keyset mode even without the cursor parameter.
+    always_keyset = False
+
+    keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.always_keyset or self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        self.request = request
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+
+        field = self.ordering.lstrip('-')
+        last_seen = self.decode_cursor(request)
+        if last_seen is not None:
+            lookup = '__lt' if self.ordering.startswith('-') else '__gt'
+            queryset = queryset.filter(**{field + lookup: last_seen})
+
+        rows = list(queryset.order_by(self.ordering)[:page_size + 1])
+        self.next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = getattr(rows[-1], field)
+        return rows
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            return int(b64decode(encoded.encode('ascii')).decode('ascii'))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, value):
+        return b64encode(str(value).encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_cursor))
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        return None
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count if self.keyset else self.page.paginator.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'rows': data, # originally 'results': data,
+        })
+
+    def get_schema_fields(self, view):
+        fields = super().get_schema_fields(view)
+        return fields + [
+            coreapi.Field(
+                name=self.cursor_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(title='Cursor', description=self.cursor_query_description)
+            ),
+            coreapi.Field(
+                name=self.count_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.Boolean(title='Count', description=self.count_query_description)
+            ),
+        ]
+
+
+class ReviewSetPagination(ProductSetPagination):
+    ordering = '-review_id'
+
+
+class OrderSetPagination(ProductSetPagination):
+    # Newest orders first, always in keyset mode: long histories page at constant cost.
+    ordering = '-order_id'
+    always_keyset = True
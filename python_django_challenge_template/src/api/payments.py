@@ -1,12 +1,26 @@
-import os
+import functools
+import logging
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 
+import requests
 import stripe
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from stripe.http_client import RequestsClient
 
+from api.models import Orders
+from api.webhooks import ORDER_PAID
 from turing_backend import settings
-import logging
 
 logger = logging.getLogger(__name__)
 
+PAYMENT_GATEWAY = getattr(settings, 'PAYMENT_GATEWAY', {})
+PAYMENT_RETRY = getattr(settings, 'PAYMENT_RETRY', {})
+
 
 class PaymentError(Exception):
     def __init__(self, message, status=None, _type=None, code=None, param=None):
@@ -20,10 +34,305 @@ class PaymentError(Exception):
         return self.message
 
 
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Fail fast after `failure_threshold` consecutive failures. Once `reset_timeout` seconds
+    have passed a single trial call is let through: its success closes the circuit, its
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self._trial):
+                raise CircuitOpenError('Circuit open after %s failures' % self.failures)
+            if state == 'half-open':
+                self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.error('Opening the payment circuit after %s failures', self.failures)
+                self.opened_at = time.monotonic()
+
+
+class PooledRequestsClient(RequestsClient):
+    """
+    Stripe HTTP client sharing one keep-alive connection pool between threads, with a
+    default timeout that can be overridden per call (see `timeout`).
+    """
+
+    def __init__(self, timeout=(3, 10), pool_size=10, **kwargs):
+        self._override = threading.local()
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        super().__init__(timeout=timeout, session=session, **kwargs)
+
+    @property
+    def _timeout(self):
+        return getattr(self._override, 'timeout', None) or self.default_timeout
+
+    @_timeout.setter
+    def _timeout(self, value):
+        self.default_timeout = value
+
+    @contextmanager
+    def timeout(self, value):
+        previous = getattr(self._override, 'timeout', None)
+        self._override.timeout = value
+        try:
+            yield
+        finally:
+            self._override.timeout = previous
+
+
+class StripeGateway:
+    """
+    Payment gateway backed by the Stripe API.
+
+    Calls go through a pooled keep-alive HTTP client with (connect, read) timeouts, and a
+    circuit breaker that fails fast while Stripe keeps failing with connection or rate
+    limit errors. The API key is passed on each call instead of being set globally.
+    """
+    # Errors telling that Stripe is unreachable or overloaded, they trip the breaker.
+    breaker_errors = (stripe.error.APIConnectionError, stripe.error.RateLimitError)
+
+    def __init__(self, api_key=None, timeout=(3, 10), charge_timeout=None, pool_size=10,
+                 failure_threshold=5, reset_timeout=30):
+        self.api_key = api_key or settings.STRIPE_API_KEY
+        self.charge_timeout = charge_timeout or timeout
+        self.http_client = PooledRequestsClient(timeout=timeout, pool_size=pool_size)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        # stripe 2.x has no per-request client option, the pool is installed once here.
+        stripe.default_http_client = self.http_client
+
+    def call(self, method, timeout=None, **params):
+        self.breaker.before_call()
+        try:
+            with self.http_client.timeout(timeout):
+                response = method(api_key=self.api_key, **params)
+        except self.breaker_errors:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return response
+
+    def charge(self, amount, currency, source, description=None, metadata=None, idempotency_key=None):
+        return self.call(stripe.Charge.create, timeout=self.charge_timeout, amount=amount, currency=currency,
+                         source=source, description=description, metadata=metadata,
+                         idempotency_key=idempotency_key)
+
+    def create_webhook_endpoint(self, url, enabled_events):
+        return self.call(stripe.WebhookEndpoint.create, url=url, enabled_events=enabled_events)
+
+
+class FakeGateway:
+    """
+    In-memory gateway for tests and local development. Calls are recorded in `charges`
+    and `webhook_endpoints`; set `error` to make the next calls raise it.
+    """
+
+    def __init__(self, **kwargs):
+        self.charges = []
+        self.webhook_endpoints = []
+        self.error = None
+        self.breaker = CircuitBreaker(**{key: kwargs[key] for key in ('failure_threshold', 'reset_timeout')
+                                         if key in kwargs})
+
+    def call(self, records, response):
+        self.breaker.before_call()
+        if self.error is not None:
+            if isinstance(self.error, StripeGateway.breaker_errors):
+                self.breaker.record_failure()
+            raise self.error
+        self.breaker.record_success()
+        records.append(response)
+        return response
+
+    def charge(self, amount, currency, source, description=None, metadata=None, idempotency_key=None):
+        return self.call(self.charges, stripe.util.convert_to_stripe_object({
+            'id': 'ch_%s' % uuid.uuid4().hex[:24],
+            'object': 'charge',
+            'amount': amount,
+            'currency': currency,
+            'description': description,
+            'metadata': metadata or {},
+            'paid': True,
+            'status': 'succeeded',
+        }))
+
+    def create_webhook_endpoint(self, url, enabled_events):
+        return self.call(self.webhook_endpoints, stripe.util.convert_to_stripe_object({
+            'id': 'we_%s' % uuid.uuid4().hex[:24],
+            'object': 'webhook_endpoint',
+            'url': url,
+            'enabled_events': enabled_events,
+            'secret': 'whsec_%s' % uuid.uuid4().hex,
+        }))
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """
+    Return the gateway configured in the PAYMENT_GATEWAY setting, built once per process.
+    """
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                options = dict(PAYMENT_GATEWAY)
+                backend = import_string(options.pop('BACKEND', 'api.payments.StripeGateway'))
+                _gateway = backend(**{key.lower(): value for key, value in options.items()})
+    return _gateway
+
+
+def set_gateway(gateway):
+    """
+    Replace the process gateway, e.g. with a `FakeGateway` in tests. `None` rebuilds it
+    from the settings on next use.
+    """
+    global _gateway
+    _gateway = gateway
+
+
+class PaymentMetrics:
+    """
+    Per operation and outcome counters of the gateway calls, with their total and slowest
+    latency in seconds. Every attempt is recorded, retries included.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, outcome, elapsed):
+        with self._lock:
+            count, total, slowest = self._data.get((operation, outcome), (0, 0.0, 0.0))
+            self._data[(operation, outcome)] = (count + 1, total + elapsed, max(slowest, elapsed))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                '%s.%s' % key: {'count': count, 'total': total, 'mean': total / count, 'max': slowest}
+                for key, (count, total, slowest) in self._data.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+
+
+payment_metrics = PaymentMetrics()
+
+
+def get_outcome(error):
+    if error is None:
+        return 'success'
+    if isinstance(error, CircuitOpenError):
+        return 'circuit_open'
+    if isinstance(error, stripe.error.StripeError):
+        return type(error).__name__
+    return 'error'
+
+
+class RetryPolicy:
+    """
+    Retry transient Stripe errors (connection and rate limit errors) up to `max_attempts`
+    times, sleeping a random delay between 0 and `base_delay * 2 ** retry` seconds (capped
+    by `max_delay`) between attempts.
+    """
+    retry_on = (stripe.error.APIConnectionError, stripe.error.RateLimitError)
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=4):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, retry):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def call(self, operation, function, *args, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            start = time.perf_counter()
+            error = None
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                error = e
+                if attempt == self.max_attempts or not isinstance(e, self.retry_on):
+                    raise
+            finally:
+                payment_metrics.record(operation, get_outcome(error), time.perf_counter() - start)
+
+            delay = self.get_delay(attempt - 1)
+            logger.warning('%s failed (attempt %s of %s), retrying in %.2fs: %s',
+                           operation, attempt, self.max_attempts, delay, error)
+            time.sleep(delay)
+
+
+retry_policy = RetryPolicy(
+    max_attempts=PAYMENT_RETRY.get('MAX_ATTEMPTS', 3),
+    base_delay=PAYMENT_RETRY.get('BASE_DELAY', 0.5),
+    max_delay=PAYMENT_RETRY.get('MAX_DELAY', 4),
+)
+
+
+def charge_idempotency_key(order_id, amount):
+    """
+    Stripe idempotency key of the charge of an order. Every charge of the order for the same
+    amount shares it, retries and manual re-charges with a new card token included, so
+    Stripe bills the order at most once. A corrected amount gets its own key.
+    """
+    return 'order-%s-charge-%s' % (order_id, amount)
+
+
 def handle_error(function):
+    """
+    Run a gateway call under `retry_policy` and convert Stripe errors into `PaymentError`.
+    """
+
+    @functools.wraps(function)
     def wrapper(*args, **kwargs):
         try:
-            function(*args, **kwargs)
+            return retry_policy.call(function.__name__, function, *args, **kwargs)
+        except PaymentError:
+            raise
+        except CircuitOpenError:
+            # Stripe kept failing recently, don't tie up the worker waiting for it
+            logger.error('Payment circuit is open')
+            raise PaymentError(message="The payment service is unavailable, try again later", status=503)
         except stripe.error.CardError as e:
             # Since it's a decline, stripe.error.CardError will be caught
             body = e.json_body
@@ -67,14 +376,17 @@ def handle_error(function):
 
 @handle_error
 def create(amount, order_id, currency="usd", source="tok_mastercard", description=None):
-    stripe.api_key = settings.STRIPE_API_KEY
+    if Orders.objects.filter(order_id=order_id, status=ORDER_PAID).exists():
+        logger.error('Order %s is already paid', order_id)
+        raise PaymentError(message="This order is already paid", status=409, code='order_already_paid')
 
-    response = stripe.Charge.create(
+    response = get_gateway().charge(
         amount=amount,
         currency=currency,
         source=source,
         description=description,
-        metadata={'order_id': order_id}
+        metadata={'order_id': order_id},
+        idempotency_key=charge_idempotency_key(order_id, amount)
     )
 
     return response
@@ -82,9 +394,7 @@ def create(amount, order_id, currency="usd", source="tok_mastercard", descriptio
 
 @handle_error
 def create_webhook():
-    stripe.api_key = settings.STRIPE_API_KEY
-
-    response = stripe.WebhookEndpoint.create(
+    response = get_gateway().create_webhook_endpoint(
         url=settings.WEBHOOK['url'],
         enabled_events=settings.WEBHOOK['enabled_events']
     )
@@ -0,0 +1,63 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.template.loader import get_template
+
+logger = logging.getLogger(__name__)
+
+
+class RenderStats:
+    """
+    Per-template render counters (count, total and slowest render time, in seconds).
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def record(self, template_name, elapsed):
+        with self._lock:
+            count, total, slowest = self._data.get(template_name, (0, 0.0, 0.0))
+            self._data[template_name] = (count + 1, total + elapsed, max(slowest, elapsed))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {'count': count, 'total': total, 'mean': total / count, 'max': slowest}
+                for name, (count, total, slowest) in self._data.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+
+
+render_stats = RenderStats()
+
+
+def render_template(template_name, context=None):
+    """
+    `render_to_string` for a single template name, recording the render time.
+    """
+    template = get_template(template_name)
+    start = time.perf_counter()
+    content = template.render(context)
+    elapsed = time.perf_counter() - start
+    render_stats.record(template_name, elapsed)
+    logger.debug("Rendered %s in %.2fms", template_name, elapsed * 1000)
+    return content
+
+
+def prewarm_templates(template_names=None):
+    """
+    Compile templates ahead of the first request, which fills the cached loader when it is
+    configured. Templates are rendered once with an empty context, so the parents of
+    `{% extends %}` are loaded too. Defaults to the PREWARM_TEMPLATES setting.
+    """
+    if template_names is None:
+        template_names = getattr(settings, 'PREWARM_TEMPLATES', ())
+    for template_name in template_names:
+        get_template(template_name).render({})
+        logger.debug("Template %s loaded", template_name)
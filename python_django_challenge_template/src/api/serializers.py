@@ -1,9 +1,51 @@
+from api.authentication import NO_CUSTOMER, CustomerAccessToken
 from api.models import (Attribute, AttributeValue, Category, Customer,
                         Department, OrderDetail, Orders, Product, Review,
                         Shipping, ShippingRegion, ShoppingCart, Tax)
-from django.contrib.auth.models import User
-from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.contrib.auth import authenticate, get_backends, user_login_failed
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, update_last_login
+from rest_framework import exceptions, serializers
+from rest_framework_simplejwt.serializers import TokenObtainSerializer
+from rest_framework_simplejwt.settings import api_settings
+from social_core.backends.base import BaseAuth
+
+# Customer columns that can be returned, the password never is.
+CUSTOMER_FIELDS = ('customer_id', 'name', 'email', 'address_1', 'address_2', 'city', 'region', 'postal_code',
+                   'country', 'shipping_region_id', 'day_phone', 'eve_phone', 'mob_phone', 'credit_card')
+# Customer columns returned without `?fields=`, the sensitive credit card is only sent on request.
+DEFAULT_CUSTOMER_FIELDS = CUSTOMER_FIELDS[:-1]
+
+
+class SparseFieldsMixin:
+    """
+    Serializer taking a `fields` argument to only serialize these fields, see
+    `get_sparse_fields`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+def get_sparse_fields(request, allowed, default=None):
+    """
+    Fields requested with `?fields=a,b` (among `allowed`), or `default` (all the allowed
+    fields when None) without the parameter. Unknown fields are a validation error.
+    """
+    requested = request.query_params.get('fields') if request is not None else None
+    if not requested:
+        return tuple(default or allowed)
+
+    fields = tuple(field for field in (name.strip() for name in requested.split(',')) if field)
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise serializers.ValidationError({'fields': ['Unknown field(s): %s' % ', '.join(unknown)]})
+    return fields or tuple(default or allowed)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -37,59 +79,99 @@ class AttributeValueSerializer(serializers.ModelSerializer):
 
 
 class AttributeValueExtendedSerializer(serializers.ModelSerializer):
-    attribute_name = serializers.SerializerMethodField()
+    attribute_name = serializers.ReadOnlyField(source='attribute.name')
     attribute_value = serializers.ReadOnlyField(source='value')
 
     class Meta:
         model = AttributeValue
         fields = ('attribute_name', 'attribute_value_id', 'attribute_value')
 
-    def get_attribute_name(self, obj):
-        attr = Attribute.objects.filter(attribute_id=obj.attribute_id).first()
-        return attr.name if attr else None
-
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ('product_id', 'name', 'description', 'price', 'discounted_price', 'thumbnail')
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Customer
-        fields = '__all__'
+        fields = CUSTOMER_FIELDS
 
 
 class OrdersSerializer(serializers.ModelSerializer):
     class Meta:
         model = Orders
-        fields = '__all__'
+        fields = ('order_id', 'total_amount', 'created_on', 'shipped_on', 'status', 'comments', 'customer_id',
+                  'auth_code', 'reference', 'shipping_id', 'tax_id')
 
 
 class OrdersDetailSerializer(serializers.ModelSerializer):
-    total_amount = serializers.ReadOnlyField(source='order.total_amount')
-    created_on = serializers.ReadOnlyField(source='order.created_on')
-    shipped_on = serializers.ReadOnlyField(source='order.shipped_on')
-    status = serializers.ReadOnlyField(source='order.status')
-    name = serializers.ReadOnlyField(source='product_name')
+    name = serializers.ReadOnlyField(source='customer.name')
 
     class Meta:
-        model = OrderDetail
+        model = Orders
         fields = ('order_id', 'total_amount', 'created_on', 'shipped_on', 'status', 'name')
 
 
+class OrderItemSerializer(serializers.ModelSerializer):
+    product_id = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        model = OrderDetail
+        fields = ('order_id', 'product_id', 'attributes', 'product_name', 'quantity', 'unit_cost', 'subtotal')
+
+
 class OrdersSaveSerializer(serializers.ModelSerializer):
+    cart_id = serializers.CharField(max_length=32)
+    tax_id = serializers.IntegerField()
+    shipping_id = serializers.IntegerField()
+
     class Meta:
         model = Orders
-        fields = ('tax_id', 'shipping_id')
+        fields = ('cart_id', 'tax_id', 'shipping_id')
 
 
 class ShoppingcartSerializer(serializers.ModelSerializer):
+    product_id = serializers.IntegerField()
+
     class Meta:
         model = ShoppingCart
         fields = ('cart_id', 'attributes', 'product_id', 'quantity')
 
 
+class CartItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    attributes = serializers.CharField(max_length=1000)
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class AddProductSerializer(CartItemSerializer):
+    cart_id = serializers.CharField(max_length=32)
+
+
+class AddProductsSerializer(serializers.Serializer):
+    cart_id = serializers.CharField(max_length=32)
+    products = CartItemSerializer(many=True, allow_empty=False)
+
+
+class CartSavedProductSerializer(serializers.Serializer):
+    item_id = serializers.IntegerField()
+    name = serializers.CharField()
+    attributes = serializers.CharField()
+    product_id = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class CartProductSerializer(CartSavedProductSerializer):
+    quantity = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class CartTotalSerializer(serializers.Serializer):
+    total_amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
 class TaxSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tax
@@ -102,20 +184,17 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = ('product_id', 'review', 'customer_id', 'rating')
 
 class ReviewOfProductSerializer(serializers.ModelSerializer):
-    name = serializers.SerializerMethodField()
+    name = serializers.ReadOnlyField(source='product.name')
+
     class Meta:
         model = Review
-        fields =('name','review','rating','created_on')
-
-    def get_name(self,obj):
-        product = Product.objects.filter(product_id=obj.product_id).first()
-        return product.name if product else None
+        fields = ('name', 'review', 'rating', 'created_on')
 
 
 class ShippingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Shipping
-        fields = '__all__'
+        fields = ('shipping_id', 'shipping_type', 'shipping_cost', 'shipping_region_id')
 
 
 class ShippingRegionSerializer(serializers.ModelSerializer):
@@ -128,6 +207,9 @@ class CreateCustomerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = ('name', 'email', 'password')
+        # Duplicates are caught by the unique keys when the customer is created (USR_04),
+        # without a lookup before it.
+        extra_kwargs = {'email': {'validators': []}}
 
 
 class UpdateCustomerSerializer(serializers.ModelSerializer):
@@ -136,19 +218,69 @@ class UpdateCustomerSerializer(serializers.ModelSerializer):
         fields = ('name', 'email', 'password', 'day_phone', 'eve_phone', 'mob_phone')
 
 
-class TokenObtainPairPatchedSerializer(TokenObtainPairSerializer):
+class TokenObtainPairPatchedSerializer(TokenObtainSerializer):
+    """
+    Check the credentials and return a single access token with the customer.
+
+    When the only backend taking passwords (the social ones only take OAuth tokens) is a
+    `ModelBackend` that keeps its `authenticate`, that check is done here against the user
+    and its customer, loaded with one joined query, with the backend's
+    `user_can_authenticate` and the `user_login_failed` signal of `authenticate()`. Other
+    backends go through `authenticate()` and a customer query. `last_login` is only updated
+    with simplejwt's `UPDATE_LAST_LOGIN`, as in its own login serializers.
+    """
+    default_error_messages = {
+        'no_active_account': 'No active account found with the given credentials'
+    }
 
     def validate(self, attrs):
-        data = super().validate(attrs)
-        refresh = self.get_token(self.user)
-        if hasattr(self.user, 'customer'):
-            data['customer'] = CustomerSerializer(self.user.customer).data
-        data['access'] = str(refresh.access_token)
-        data['expires_in'] = "24h"
-        data.pop('refresh')
-
+        request = self.context.get('request')
+        fields = get_sparse_fields(request, CUSTOMER_FIELDS, DEFAULT_CUSTOMER_FIELDS)
+        backends = [backend for backend in get_backends() if not isinstance(backend, BaseAuth)]
+        if (len(backends) == 1 and isinstance(backends[0], ModelBackend)
+                and type(backends[0]).authenticate is ModelBackend.authenticate):
+            self.user, customer = self.check_credentials(backends[0], attrs, fields)
+        else:
+            self.user = authenticate(request, **{
+                self.username_field: attrs[self.username_field],
+                'password': attrs['password'],
+            })
+            customer = None
+            if self.user is not None:
+                customer = Customer.objects.only(*fields).filter(user_id=self.user.pk).first()
+
+        if self.user is None or not self.user.is_active:
+            raise exceptions.AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, self.user)
+        token = CustomerAccessToken.for_user(self.user, customer_id=customer.customer_id if customer else NO_CUSTOMER)
+        data = {'access': str(token), 'expires_in': "24h"}
+        if customer is not None:
+            data['customer'] = CustomerSerializer(customer, fields=fields).data
         return data
 
+    def check_credentials(self, backend, attrs, fields):
+        """
+        `backend.authenticate` (a `ModelBackend`) with the customer joined in. Returns the
+        user and its customer (or None), or (None, None) for wrong credentials.
+        """
+        user = User.objects.select_related('customer').only(
+            'id', 'password', 'is_active', 'customer__customer_id', *['customer__%s' % field for field in fields]
+        ).filter(**{self.username_field: attrs[self.username_field]}).first()
+
+        if user is None:
+            # Hash anyway, unknown emails must not answer faster than wrong passwords.
+            make_password(attrs['password'])
+        elif user.check_password(attrs['password']) and backend.user_can_authenticate(user):
+            return user, getattr(user, 'customer', None)
+
+        user_login_failed.send(sender=__name__, request=self.context.get('request'), credentials={
+            self.username_field: attrs[self.username_field],
+            'password': '********************',
+        })
+        return None, None
+
 
 class SocialSerializer(serializers.Serializer):
     """
@@ -179,9 +311,3 @@ class CreditCardSerializer(serializers.Serializer):
 
     class Meta:
         fields = 'credit_card'
-
-
-class CategorySerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Category
-        fields = ['category_id', 'name', 'description', 'department_id']
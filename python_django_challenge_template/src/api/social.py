@@ -0,0 +1,70 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from social_core.backends import facebook
+
+logger = logging.getLogger(__name__)
+
+SOCIAL_LOGIN = getattr(settings, 'SOCIAL_LOGIN', {})
+
+
+class CachedProfileMixin:
+    """
+    Keep the provider profile of an access token in the Django cache for
+    `SOCIAL_LOGIN['PROFILE_TIMEOUT']` seconds, keyed on the SHA-256 of the token, so a
+    client retrying a login does not call the provider again. The token itself is not stored.
+    """
+    profile_prefix = 'social:profile'
+
+    def profile_key(self, access_token):
+        return '%s:%s:%s' % (self.profile_prefix, self.name,
+                             hashlib.sha256(access_token.encode('utf-8')).hexdigest())
+
+    def fetch_profile(self, access_token, *args, **kwargs):
+        return super().user_data(access_token, *args, **kwargs)
+
+    def user_data(self, access_token, *args, **kwargs):
+        timeout = SOCIAL_LOGIN.get('PROFILE_TIMEOUT', 60)
+        if not timeout or not isinstance(access_token, str):
+            return self.fetch_profile(access_token, *args, **kwargs)
+
+        key = self.profile_key(access_token)
+        data = cache.get(key)
+        if data is None:
+            data = self.fetch_profile(access_token, *args, **kwargs)
+            if data:
+                cache.set(key, data, timeout)
+        else:
+            logger.debug("Using the cached %s profile", self.name)
+        # do_auth adds the access token to the profile, never hand out the cached dict.
+        return dict(data) if data else data
+
+
+class FacebookOAuth2(CachedProfileMixin, facebook.FacebookOAuth2):
+    pass
+
+
+class StubFacebookOAuth2(FacebookOAuth2):
+    """
+    Facebook backend answering from the token, without any network call, for benchmarks
+    and local runs. The token `stub-42` is the user `stub42@example.com`. `latency` seconds
+    are spent on every profile request to stand for the Graph API round trip.
+    Never list it in AUTHENTICATION_BACKENDS outside development.
+    """
+    name = 'facebook-stub'
+    latency = 0
+    requests = 0
+
+    def get_key_and_secret(self):
+        return 'stub', 'stub'
+
+    def fetch_profile(self, access_token, *args, **kwargs):
+        StubFacebookOAuth2.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        uid = access_token.rpartition('-')[2]
+        return {'id': uid, 'name': 'Stub User%s' % uid, 'first_name': 'Stub', 'last_name': 'User%s' % uid,
+                'email': 'stub%s@example.com' % uid}
@@ -1,3 +1,976 @@
-from django.test import TestCase
+import gc
+import json
+import os
+import runpy
+import threading
+import time
+from base64 import b64encode
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import stripe
+from api import payments
+from api.audit import (ORDER_EMAIL_FAILED, ORDER_EMAIL_SENT, PAYMENT_RECEIVED, AuditBuffer, AuditLog, audit,
+                       audit_log)
+from api.authentication import (JWT_TOKEN_CACHE, JWT_TOKEN_USER, CustomerAccessToken, CustomerJWTAuthentication,
+                                CustomerTokenUser, revocation_list, token_cache)
+from api.cache import catalog_cache
+from api.credit_cards import validate_credit_card
+from api.emails import claim_order_emails, send_order_emails
+from api.filters import FullTextSearchFilter
+from api.models import (Attribute, AttributeValue, Audit, Category, Customer, Department, OrderDetail, OrderEmail,
+                        Orders, Product, ProductAttribute, ProductCategory, Review, Shipping, ShoppingCart,
+                        StripeEvent, Tax)
+from api.payments import FakeGateway, PaymentError, payment_metrics, set_gateway
+from api.social import StubFacebookOAuth2
+from api.viewsets.customers import SocialLoginView
+from api.viewsets.products import ProductViewSet
+from api.viewsets.shoppingcart import add_to_cart
+from api.webhooks import ORDER_PAID, ORDER_PAYMENT_FAILED, process_stripe_events
+from django.apps import apps
+from django.contrib.auth import user_login_failed
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connection, connections
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings, skipUnlessDBFeature)
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from social_core.backends.utils import load_backends
+from turing_backend import settings
+
+# Tables with a composite primary key, Django only sees their first column.
+COMPOSITE_KEY_TABLES = {
+    'product_attribute': 'CREATE TABLE product_attribute (product_id INT NOT NULL, attribute_value_id INT NOT NULL, '
+                         'PRIMARY KEY (product_id, attribute_value_id))',
+    'product_category': 'CREATE TABLE product_category (product_id INT NOT NULL, category_id INT NOT NULL, '
+                        'PRIMARY KEY (product_id, category_id))',
+}
+
+
+def create_unmanaged_tables():
+    """
+    The schema comes from sql/database.sql, the test database only gets the tables of the
+    migrations. Create the unmanaged ones.
+    """
+    existing = set(connection.introspection.table_names())
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config('api').get_models():
+            table = model._meta.db_table
+            if model._meta.managed or table in existing:
+                continue
+            if table in COMPOSITE_KEY_TABLES:
+                editor.execute(COMPOSITE_KEY_TABLES[table])
+            else:
+                editor.create_model(model)
+
+
+class ApiTestMixin:
+
+    @classmethod
+    def setUpClass(cls):
+        create_unmanaged_tables()
+        super().setUpClass()
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+        self.client = APIClient()
+
+    def create_product(self, name='Product', price=10, discounted_price=0):
+        return Product.objects.create(name=name, description=name, price=price, discounted_price=discounted_price,
+                                      display=0)
+
+    def create_customer(self, email='customer@example.com'):
+        user = User.objects.create_user(username=email, email=email, password='secret123')
+        customer = Customer.objects.create(user=user, name='Customer', email=email, shipping_region_id=1)
+        return user, customer
+
+    def create_order(self, customer=None, **kwargs):
+        kwargs.setdefault('total_amount', 10)
+        kwargs.setdefault('status', 0)
+        return Orders.objects.create(customer=customer, created_on=timezone.now(), **kwargs)
+
+    def create_stripe_event(self, event_id, event_type, order, created=0):
+        return StripeEvent.objects.create(event_id=event_id, type=event_type, payload=json.dumps({
+            'id': event_id, 'type': event_type, 'created': created,
+            'data': {'object': {'id': 'ch_%s' % event_id, 'metadata': {'order_id': str(order.order_id)}}},
+        }))
+
+
+class ApiTestCase(ApiTestMixin, TestCase):
+
+    def create_catalog(self, departments=1, categories=1, products=3, display=0):
+        """
+        `departments` departments of `categories` categories of `products` products each.
+        """
+        for department_index in range(departments):
+            department = Department.objects.create(name='Department %s' % department_index)
+            for category_index in range(categories):
+                category = Category.objects.create(department=department, name='Category %s' % category_index)
+                for _ in range(products):
+                    product = self.create_product()
+                    Product.objects.filter(pk=product.pk).update(display=display)
+                    ProductCategory.objects.create(product=product, category=category)
+        return department
+
+    def create_cart(self, cart_id='cart', items=((10, 2), (4, 1))):
+        """
+        A cart with a (price, quantity) item per product, returns the products.
+        """
+        products = []
+        for price, quantity in items:
+            product = self.create_product('Product %s' % price, price=price)
+            ShoppingCart.objects.create(cart_id=cart_id, product=product, attributes='LG',
+                                        attributes_hash='hash-%s' % product.product_id, quantity=quantity,
+                                        buy_now=True, added_on=timezone.now())
+            products.append(product)
+        return products
+
+
+class CreditCardTests(SimpleTestCase):
+
+    def test_valid_numbers(self):
+        self.assertTrue(validate_credit_card('4532015112830366'))
+        self.assertTrue(validate_credit_card('4532-0151-1283-0366'))
+
+    def test_invalid_numbers(self):
+        self.assertFalse(validate_credit_card('4532015112830367'))  # Luhn
+        self.assertFalse(validate_credit_card('4111111111111111'))  # run of 4
+        self.assertFalse(validate_credit_card('4532-0151-1283-036'))
+        self.assertFalse(validate_credit_card(None))
+        self.assertFalse(validate_credit_card(4532015112830366))
+
+    def test_unicode_digits(self):
+        self.assertFalse(validate_credit_card('١٢' * 8))
+        self.assertFalse(validate_credit_card('-'.join(['４５３２'] * 4)))
+
+
+class UpdateCreditCardTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.customer = self.create_customer()
+        self.client.force_authenticate(self.user)
+
+    def test_update(self):
+        response = self.client.put('/customers/creditCard', {'credit_card': '4532-0151-1283-0366'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.credit_card, '4532-0151-1283-0366')
+
+    def test_unicode_digits(self):
+        response = self.client.put('/customers/creditCard', {'credit_card': '١٢' * 8}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error']['code'], 'USR_08')
+
+
+class CustomerFieldsTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.customer = self.create_customer()
+        self.customer.credit_card = '4532-0151-1283-0366'
+        self.customer.save(update_fields=['credit_card'])
+
+    def test_credit_card_only_on_request(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/customer')
+        self.assertEqual(response.data['email'], 'customer@example.com')
+        self.assertNotIn('credit_card', response.data)
+
+        response = self.client.get('/customer', {'fields': 'name,credit_card'})
+        self.assertEqual(response.data, {'name': 'Customer', 'credit_card': '4532-0151-1283-0366'})
+
+    def test_update_credit_card(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.put('/customers/creditCard', {'credit_card': '4532-0151-1283-0366'}, format='json')
+        self.assertNotIn('credit_card', response.data)
+
+        response = self.client.put('/customers/creditCard?fields=credit_card', {
+            'credit_card': '4532-0151-1283-0366'
+        }, format='json')
+        self.assertEqual(response.data, {'credit_card': '4532-0151-1283-0366'})
+
+    def test_register_and_login(self):
+        response = self.client.post('/customers', {
+            'name': 'New', 'email': 'new@example.com', 'password': 'secret123'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('credit_card', response.data['customer'])
+
+        response = self.client.post('/customers/login', {
+            'username': 'customer@example.com', 'password': 'secret123'
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('credit_card', response.data['customer'])
+
+
+class BlockingBackend(ModelBackend):
+    """
+    `ModelBackend` also refusing the users in `blocked`.
+    """
+    blocked = set()
+
+    def user_can_authenticate(self, user):
+        return user.pk not in self.blocked and super().user_can_authenticate(user)
+
+
+class EmailBackend(ModelBackend):
+    """
+    `ModelBackend` taking the email as username.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = User.objects.filter(email=username).first()
+        if user is not None and user.check_password(password) and self.user_can_authenticate(user):
+            return user
+
+
+class LoginTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.customer = self.create_customer()
+        self.receiver = mock.Mock()
+        user_login_failed.connect(self.receiver)
+        self.addCleanup(user_login_failed.disconnect, self.receiver)
+
+    def login(self, username='customer@example.com', password='secret123'):
+        return self.client.post('/customers/login', {'username': username, 'password': password}, format='json')
+
+    def test_login(self):
+        # The user and its customer, without any write.
+        with self.assertNumQueries(1):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['customer']['customer_id'], self.customer.customer_id)
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.last_login)
+
+    def test_user_without_customer(self):
+        User.objects.create_user(username='staff@example.com', password='secret123')
+        with self.assertNumQueries(1):
+            response = self.login('staff@example.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('customer', response.data)
+
+    def test_update_last_login(self):
+        with mock.patch.object(api_settings, 'UPDATE_LAST_LOGIN', True):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_wrong_password(self):
+        response = self.login(password='wrong')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.receiver.call_args[1]['credentials'], {
+            'username': 'customer@example.com', 'password': '********************'
+        })
+
+    @override_settings(AUTHENTICATION_BACKENDS=['api.tests.BlockingBackend'])
+    def test_model_backend_subclass(self):
+        with mock.patch.object(BlockingBackend, 'blocked', {self.user.pk}):
+            response = self.login()
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(self.receiver.called)
+
+        with self.assertNumQueries(1):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(AUTHENTICATION_BACKENDS=['api.tests.EmailBackend'])
+    def test_other_backends(self):
+        user = User.objects.create_user(username='login-name', email='mail@example.com', password='secret123')
+        customer = Customer.objects.create(user=user, name='Mail', email='mail@example.com', shipping_region_id=1)
+        response = self.login('mail@example.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['customer']['customer_id'], customer.customer_id)
+
+        response = self.login('mail@example.com', password='wrong')
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(self.receiver.called)
+
+
+class FlakyGateway(FakeGateway):
+    """
+    Fake gateway raising `errors` on its first calls, then succeeding.
+    """
+
+    def __init__(self, *errors):
+        super().__init__()
+        self.errors = list(errors)
+        self.idempotency_keys = []
+
+    def charge(self, *args, **kwargs):
+        self.idempotency_keys.append(kwargs['idempotency_key'])
+        self.error = self.errors.pop(0) if self.errors else None
+        return super().charge(*args, **kwargs)
+
+
+class ChargeTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        payment_metrics.reset()
+        self.addCleanup(set_gateway, None)
+        sleep = mock.patch('api.payments.time.sleep')
+        sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def test_transient_errors_are_retried(self):
+        gateway = FlakyGateway(stripe.error.APIConnectionError('down'), stripe.error.RateLimitError('slow'))
+        set_gateway(gateway)
+        charge = payments.create(999, order_id=1, source='tok_visa')
+
+        self.assertEqual(charge['amount'], 999)
+        self.assertEqual(gateway.charges, [charge])
+        self.assertEqual(gateway.idempotency_keys, ['order-1-charge-999'] * 3)
+        metrics = payment_metrics.snapshot()
+        self.assertEqual({name: stats['count'] for name, stats in metrics.items()}, {
+            'create.APIConnectionError': 1, 'create.RateLimitError': 1, 'create.success': 1,
+        })
+
+    def test_recharge_with_another_token_reuses_the_key(self):
+        gateway = FlakyGateway()
+        set_gateway(gateway)
+        payments.create(999, order_id=1, source='tok_visa')
+        payments.create(999, order_id=1, source='tok_mastercard')
+        self.assertEqual(gateway.idempotency_keys, ['order-1-charge-999'] * 2)
+
+    def test_paid_order_is_not_charged(self):
+        gateway = FlakyGateway()
+        set_gateway(gateway)
+        order = self.create_order(status=ORDER_PAID)
+        with self.assertRaises(PaymentError) as context:
+            payments.create(999, order_id=order.order_id)
+        self.assertEqual(context.exception.status, 409)
+        self.assertEqual(gateway.idempotency_keys, [])
+
+
+class RegistrationTests(ApiTestCase):
+
+    def register(self, email='new@example.com'):
+        return self.client.post('/customers', {'name': 'New', 'email': email, 'password': 'secret123'},
+                                format='json')
+
+    def test_one_transaction(self):
+        with mock.patch.object(Customer.objects, 'create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.register()
+        self.assertFalse(User.objects.filter(username='new@example.com').exists())
+
+        self.assertEqual(self.register().status_code, 201)
+        self.assertEqual(Customer.objects.get(email='new@example.com').user.username, 'new@example.com')
+
+    def test_duplicate_email(self):
+        self.assertEqual(self.register().status_code, 201)
+        response = self.register()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error']['code'], 'USR_04')
+        self.assertEqual(User.objects.filter(username='new@example.com').count(), 1)
+        self.assertEqual(Customer.objects.filter(email='new@example.com').count(), 1)
+
+    def test_unknown_hasher_profile(self):
+        with mock.patch.dict('os.environ', PASSWORD_HASHER_PROFILE='md5'):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'use one of: argon2, bcrypt, pbkdf2'):
+                runpy.run_path(os.path.join(settings.BASE_DIR, 'settings', 'base.py'))
+
+
+class SocialLoginTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        backends = settings.AUTHENTICATION_BACKENDS + ('api.social.StubFacebookOAuth2',)
+        # social_django reads AUTHENTICATION_BACKENDS once, register the stub in its cache.
+        load_backends(backends, force_load=True)
+        self.addCleanup(load_backends, settings.AUTHENTICATION_BACKENDS, force_load=True)
+        backends_override = override_settings(AUTHENTICATION_BACKENDS=backends)
+        backends_override.enable()
+        self.addCleanup(backends_override.disable)
+        for patcher in (mock.patch.object(SocialLoginView, 'provider', StubFacebookOAuth2.name),
+                        mock.patch.object(StubFacebookOAuth2, 'requests', 0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def login(self, access_token):
+        response = self.client.post('/customers/facebook', {'access_token': access_token}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['customer']['schema']
+
+    def test_profile_requested_once(self):
+        customer = self.login('stub-7')
+        self.assertEqual(StubFacebookOAuth2.requests, 1)
+        self.assertEqual(customer['email'], 'stub7@example.com')
+
+        # A retry of the same token is answered from the profile cache.
+        self.assertEqual(self.login('stub-7')['customer_id'], customer['customer_id'])
+        self.assertEqual(StubFacebookOAuth2.requests, 1)
+
+        self.login('stub-8')
+        self.assertEqual(StubFacebookOAuth2.requests, 2)
+
+    def test_customer_found_by_user(self):
+        customer_id = self.login('stub-7')['customer_id']
+        Customer.objects.filter(pk=customer_id).update(email='changed@example.com')
+        cache.clear()
+
+        customer = self.login('stub-7')
+        self.assertEqual((customer['customer_id'], customer['email']), (customer_id, 'changed@example.com'))
+        self.assertEqual(StubFacebookOAuth2.requests, 2)
+        self.assertEqual(Customer.objects.count(), 1)
+
+
+class AuditTests(ApiTestCase):
+
+    def test_failed_flush_keeps_rows(self):
+        order = self.create_order()
+        buffer = AuditBuffer(max_size=10, max_age=60)
+        buffer.add(order.order_id, 'Order created', 10000)
+        with mock.patch.object(Audit.objects, 'bulk_create', side_effect=DatabaseError):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(buffer.rows), 1)
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(Audit.objects.filter(order=order).count(), 1)
+
+    def test_requeue_is_bounded(self):
+        buffer = AuditBuffer(max_size=10, max_age=60, max_pending=3)
+        for index in range(5):
+            buffer.add(index, 'Order created', 10000)
+        with mock.patch.object(Audit.objects, 'bulk_create', side_effect=DatabaseError):
+            buffer.flush()
+        self.assertEqual([row.order_id for row in buffer.rows], [2, 3, 4])
+
+    def test_flush_due(self):
+        order = self.create_order()
+        audit(order.order_id, 'Order created', 10000)
+        self.assertEqual(audit_log.flush_due(), 0)
+        audit_log.buffer.started -= audit_log.max_age
+        self.assertEqual(audit_log.flush_due(), 1)
+        self.assertEqual(Audit.objects.filter(order=order).count(), 1)
+
+    def test_rows_outlive_their_thread(self):
+        order = self.create_order()
+        log = AuditLog(max_size=10, max_age=3600)
+
+        def add():
+            log.add(order.order_id, 'Order created', 10000)
+            with mock.patch.object(Audit.objects, 'bulk_create', side_effect=DatabaseError):
+                log.flush()
+
+        thread = threading.Thread(target=add)
+        thread.start()
+        thread.join()
+        gc.collect()
+
+        self.assertEqual(log.flush_all(), 1)
+        self.assertEqual(Audit.objects.filter(order=order).count(), 1)
+        # Written and its thread gone, the buffer is released.
+        self.assertEqual(len(log._buffers), 0)
+
+
+class StripeEventTests(ApiTestCase):
+
+    def test_failed_audit_write_leaves_events_to_retry(self):
+        order = self.create_order()
+        event = self.create_stripe_event('evt_1', 'charge.succeeded', order)
+        with mock.patch.object(Audit.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                process_stripe_events()
+        event.refresh_from_db()
+        self.assertEqual(event.status, StripeEvent.PROCESSING)
+
+        StripeEvent.objects.filter(pk=event.pk).update(next_attempt_on=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(process_stripe_events(), 1)
+        event.refresh_from_db()
+        self.assertEqual(event.status, StripeEvent.PROCESSED)
+        self.assertEqual(Audit.objects.filter(order=order, code=PAYMENT_RECEIVED).count(), 1)
+
+    def test_webhook_body_not_utf8(self):
+        with mock.patch.dict(settings.WEBHOOK, secret='whsec_test'):
+            response = self.client.post('/stripe/webhooks', b'\xff\xfe{}', content_type='application/json',
+                                        HTTP_STRIPE_SIGNATURE='t=1,v1=0')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error']['code'], 'STR_01')
+
+    def test_latest_event_wins(self):
+        order = self.create_order()
+        self.create_stripe_event('evt_2', 'charge.failed', order, created=200)
+        self.create_stripe_event('evt_1', 'charge.failed', order, created=100)
+        process_stripe_events()
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.reference), (ORDER_PAYMENT_FAILED, 'ch_evt_2'))
+
+    def test_late_failure_keeps_order_paid(self):
+        order = self.create_order()
+        self.create_stripe_event('evt_1', 'charge.succeeded', order, created=200)
+        self.create_stripe_event('evt_2', 'charge.failed', order, created=100)
+        self.create_stripe_event('evt_3', 'charge.failed', order, created=300)
+        process_stripe_events()
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.reference), (ORDER_PAID, 'ch_evt_1'))
+
+        # Redelivered in a later batch.
+        self.create_stripe_event('evt_4', 'charge.failed', order, created=400)
+        process_stripe_events()
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.reference), (ORDER_PAID, 'ch_evt_1'))
+        self.assertEqual(Audit.objects.filter(order=order).count(), 4)
+
+
+class AddToCartConcurrencyTests(ApiTestMixin, TransactionTestCase):
+
+    def tearDown(self):
+        # Unmanaged tables are not flushed between transaction tests.
+        ShoppingCart.objects.all().delete()
+        Product.objects.all().delete()
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_adds(self):
+        first, second = self.create_product('First', price=10), self.create_product('Second', price=3)
+        threads, adds = 8, 10
+        barrier = threading.Barrier(threads)
+        errors = []
+
+        def add():
+            try:
+                barrier.wait()
+                for _ in range(adds):
+                    add_to_cart('cart', [{'product_id': first.product_id, 'attributes': 'LG, Red', 'quantity': 1},
+                                         {'product_id': second.product_id, 'attributes': 'S', 'quantity': 2}])
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=add) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        rows = list(ShoppingCart.objects.filter(cart_id='cart').order_by('item_id').values_list('product_id',
+                                                                                              'quantity'))
+        self.assertEqual(rows, [(first.product_id, threads * adds), (second.product_id, 2 * threads * adds)])
+        response = self.client.get('/shoppingcart/totalAmount/cart')
+        self.assertEqual(Decimal(response.data['total_amount']), 10 * threads * adds + 3 * 2 * threads * adds)
+
+    def test_attributes_sharing_a_prefix(self):
+        product = self.create_product()
+        prefix = 'x' * 300
+        add_to_cart('cart', [{'product_id': product.product_id, 'attributes': prefix + 'a', 'quantity': 1},
+                             {'product_id': product.product_id, 'attributes': prefix + 'b', 'quantity': 1}])
+        self.assertEqual(ShoppingCart.objects.filter(cart_id='cart').count(), 2)
+
+
+class OrderEmailTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.customer = self.create_customer()
+        self.client.force_authenticate(self.user)
+        self.create_cart()
+        self.shipping = Shipping.objects.create(shipping_type='Standard', shipping_cost=5, shipping_region_id=2)
+        self.tax = Tax.objects.create(tax_type='No tax', tax_percentage=0)
+
+    def create_order_request(self):
+        return self.client.post('/orders/create', {
+            'cart_id': 'cart', 'shipping_id': self.shipping.shipping_id, 'tax_id': self.tax.tax_id
+        }, format='json')
+
+    def test_order_queues_email(self):
+        response = self.create_order_request()
+        self.assertEqual(response.status_code, 200)
+        email = OrderEmail.objects.get(order_id=response.data['orderId'])
+        self.assertEqual((email.status, email.to_email), (OrderEmail.PENDING, self.customer.email))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_failed_outbox_write_cancels_order(self):
+        with mock.patch('api.viewsets.orders.queue_order_email', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.create_order_request()
+        self.assertFalse(Orders.objects.exists())
+        self.assertFalse(OrderDetail.objects.exists())
+        self.assertEqual(ShoppingCart.objects.filter(cart_id='cart').count(), 2)
+
+    def test_send(self):
+        order_id = self.create_order_request().data['orderId']
+        self.assertEqual(send_order_emails(), 1)
+
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, [self.customer.email])
+        self.assertIn('ORDER ID: %s' % order_id, message.body)
+        self.assertNotIn('<', message.body)
+        html, mimetype = message.alternatives[0]
+        self.assertEqual(mimetype, 'text/html')
+        self.assertIn(str(order_id), html)
+
+        email = OrderEmail.objects.get(order_id=order_id)
+        self.assertEqual((email.status, email.attempts), (OrderEmail.SENT, 1))
+        audit_log.flush()
+        self.assertTrue(Audit.objects.filter(order_id=order_id, code=ORDER_EMAIL_SENT).exists())
+        self.assertEqual(send_order_emails(), 0)
+
+    def test_failed_send_is_retried(self):
+        order_id = self.create_order_request().data['orderId']
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', side_effect=OSError('refused')):
+            self.assertEqual(send_order_emails(max_attempts=2), 0)
+            email = OrderEmail.objects.get(order_id=order_id)
+            self.assertEqual((email.status, email.attempts), (OrderEmail.PENDING, 1))
+            self.assertGreater(email.next_attempt_on, timezone.now())
+
+            OrderEmail.objects.filter(pk=email.pk).update(next_attempt_on=timezone.now())
+            send_order_emails(max_attempts=2)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.last_error), (OrderEmail.FAILED, 2, 'refused'))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_expired_lease_counts_as_attempt(self):
+        order_id = self.create_order_request().data['orderId']
+        # A worker dies while sending, twice: each claim counts as an attempt.
+        for attempts in (1, 2):
+            self.assertEqual(len(claim_order_emails(10, lease=600, max_attempts=2)), 1)
+            email = OrderEmail.objects.get(order_id=order_id)
+            self.assertEqual((email.status, email.attempts), (OrderEmail.SENDING, attempts))
+            OrderEmail.objects.filter(pk=email.pk).update(next_attempt_on=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(send_order_emails(max_attempts=2), 0)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.last_error), (OrderEmail.FAILED, 2, 'Lease expired'))
+        self.assertEqual(len(mail.outbox), 0)
+        audit_log.flush()
+        self.assertTrue(Audit.objects.filter(order_id=order_id, code=ORDER_EMAIL_FAILED).exists())
+
+
+class FullTextSearchFilterTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name in ('Red Rose', 'Blue Rose', 'Red Tulip'):
+            self.create_product(name)
+
+    def search(self, **params):
+        response = self.client.get('/products/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['name'] for row in response.data['rows'])
+
+    def test_fallback(self):
+        self.assertEqual(self.search(search='red rose'), ['Blue Rose', 'Red Rose', 'Red Tulip'])
+        self.assertEqual(self.search(search='red rose', all_words='on'), ['Red Rose'])
+
+    def test_get_against(self):
+        search = FullTextSearchFilter()
+        self.assertEqual(search.get_against(['red', 'rose'], all_words=False), 'red rose')
+        self.assertEqual(search.get_against(['red', '-ro(se)*', '"~"'], all_words=True), '+red +rose')
+
+    def test_fulltext_query(self):
+        request = Request(APIRequestFactory().get('/products/search/', {'search': 'roses', 'all_words': 'on'}))
+        view = ProductViewSet(request=request, format_kwarg=None)
+        with mock.patch.object(FullTextSearchFilter, 'use_fulltext', return_value=True):
+            queryset = FullTextSearchFilter().filter_queryset(request, Product.objects.order_by('product_id'), view)
+        self.assertIn('MATCH (', str(queryset.query))
+        self.assertIn('AGAINST (+roses IN BOOLEAN MODE)', str(queryset.query))
+        self.assertEqual(queryset.query.order_by, ('-relevance', 'product_id'))
+
+    def test_cursor_is_rejected(self):
+        response = self.client.get('/products/search/', {'search': 'red', 'cursor': ''})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.data)
+
+
+class CatalogCacheTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.department = Department.objects.create(name='Regional')
+
+    def test_hit_without_queries(self):
+        response = self.client.get('/departments/')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            cached = self.client.get('/departments/')
+        self.assertEqual(cached.data, response.data)
+
+    def test_save_and_delete_bump_version(self):
+        version = catalog_cache.get_version('department')
+        self.client.get('/departments/')
+
+        Department.objects.create(name='Seasonal')
+        saved = catalog_cache.get_version('department')
+        self.assertGreater(saved, version)
+        self.assertEqual(len(self.client.get('/departments/').data), 2)
+
+        self.department.delete()
+        self.assertGreater(catalog_cache.get_version('department'), saved)
+        self.assertEqual([row['name'] for row in self.client.get('/departments/').data], ['Seasonal'])
+
+    def test_not_modified(self):
+        response = self.client.get('/departments/')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/departments/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.department.name = 'Renamed'
+        self.department.save()
+        response = self.client.get('/departments/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data[0]['name'], 'Renamed')
+
+    def test_product_write_changes_etag(self):
+        product = self.create_product()
+        etag = self.client.get('/products/%s/' % product.product_id)['ETag']
+        self.assertEqual(self.client.get('/products/%s/' % product.product_id,
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        product.price = 20
+        product.save()
+        response = self.client.get('/products/%s/' % product.product_id, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['price'], '20.00')
+
+
+class TokenUserAuthenticationTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.customer = self.create_customer()
+        self.token = str(CustomerAccessToken.for_user(self.user))
+        revocation_list.local.clear()
+        token_user = mock.patch.dict(JWT_TOKEN_USER, ENABLED=True)
+        token_user.start()
+        self.addCleanup(token_user.stop)
+
+    def authenticate(self, token=None):
+        request = APIRequestFactory().get('/customer', HTTP_AUTHORIZATION='Bearer %s' % (token or self.token))
+        return CustomerJWTAuthentication().authenticate(Request(request))
+
+    def test_no_user_query(self):
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+        self.assertIsInstance(user, CustomerTokenUser)
+        self.assertEqual((user.pk, user.customer_id), (self.user.pk, self.customer.customer_id))
+
+        with mock.patch.dict(JWT_TOKEN_USER, ENABLED=False), self.assertNumQueries(1):
+            user, _ = self.authenticate()
+        self.assertIsInstance(user, User)
+
+    def test_deactivated_user_is_revoked(self):
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed) as context:
+            self.authenticate()
+        self.assertEqual(context.exception.detail['code'], 'token_revoked')
+
+
+class TokenCacheTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, _ = self.create_customer()
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        token_cache_settings = mock.patch.dict(JWT_TOKEN_CACHE, ENABLED=True)
+        token_cache_settings.start()
+        self.addCleanup(token_cache_settings.stop)
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/customer', HTTP_AUTHORIZATION='Bearer %s' % token)
+        return CustomerJWTAuthentication().authenticate(Request(request))
+
+    def test_hit_skips_verification(self):
+        token = str(CustomerAccessToken.for_user(self.user))
+        self.authenticate(token)
+        with mock.patch.object(JWTAuthentication, 'get_validated_token', side_effect=AssertionError('verified')):
+            user, _ = self.authenticate(token)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(token_cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_entry_expires_with_the_token(self):
+        token = CustomerAccessToken.for_user(self.user)
+        token.set_exp(lifetime=timedelta(seconds=30))
+        self.authenticate(str(token))
+
+        # Past `exp` but within the cache timeout, the token is verified again and rejected.
+        later = time.monotonic() + 31
+        with mock.patch('api.cache.time.monotonic', return_value=later), \
+                mock.patch.object(JWTAuthentication, 'get_validated_token',
+                                  side_effect=InvalidToken('Token is invalid or expired')) as verify:
+            with self.assertRaises(InvalidToken):
+                self.authenticate(str(token))
+        verify.assert_called_once_with(str(token).encode('utf-8'))
+
+    def test_expired_token_is_not_cached(self):
+        token = CustomerAccessToken.for_user(self.user)
+        token.set_exp(lifetime=timedelta(seconds=-1))
+        token_cache.set(str(token), token)
+        self.assertIsNone(token_cache.get(str(token)))
+
+
+class ProductsByDepartmentTests(ApiTestCase):
+
+    def test_products(self):
+        department = self.create_catalog(categories=2, products=3)
+        response = self.client.get('/products/inDepartment/%s' % department.department_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['count'], len(response.data['rows'])), (6, 6))
+
+    def test_unknown_department(self):
+        response = self.client.get('/products/inDepartment/999')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['error']['code'], 'DEP_02')
+
+    def test_no_displayed_products(self):
+        department = self.create_catalog(display=0)
+        response = self.client.get('/products/inDepartment/%s?displayed=true' % department.department_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rows'], [])
+
+    def test_cursor_past_last_page(self):
+        department = self.create_catalog(products=2)
+        response = self.client.get('/products/inDepartment/%s?cursor=&limit=2' % department.department_id)
+        self.assertEqual(len(response.data['rows']), 2)
+        last = response.data['rows'][-1]['product_id']
+        response = self.client.get('/products/inDepartment/%s' % department.department_id,
+                                   {'cursor': b64encode(str(last).encode()).decode(), 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['rows'], response.data['next']), ([], None))
+
+
+class OrderQueryTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.customer = self.create_customer()
+        self.client.force_authenticate(self.user)
+
+    def create_orders(self, orders, items):
+        created = []
+        for _ in range(orders):
+            order = self.create_order(self.customer)
+            for index in range(items):
+                OrderDetail.objects.create(order=order, product_id=index + 1, attributes='LG',
+                                           product_name='Product %s' % index, quantity=2, unit_cost=5)
+            created.append(order)
+        return created
+
+    def test_orders(self):
+        for count in (1, 30):
+            self.create_orders(count, 2)
+            with self.assertNumQueries(1):
+                response = self.client.get('/orders')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['rows'][0]['name'], 'Customer')
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/orders', {'count': 'true'}).data['count'], 31)
+
+    def test_order(self):
+        for items in (1, 20):
+            order = self.create_orders(1, items)[0]
+            with self.assertNumQueries(1):
+                response = self.client.get('/orders/%s' % order.order_id)
+            self.assertEqual(len(response.data), items)
+
+    def test_order_details(self):
+        order = self.create_orders(1, 5)[0]
+        with self.assertNumQueries(1):
+            response = self.client.get('/orders/%s/details' % order.order_id)
+        self.assertEqual(response.data['order_id'], order.order_id)
+
+    def test_other_customer(self):
+        order = self.create_orders(1, 1)[0]
+        other, _ = self.create_customer('other@example.com')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get('/orders/%s' % order.order_id).status_code, 404)
+        self.assertEqual(self.client.get('/orders/%s/details' % order.order_id).status_code, 404)
+        self.assertEqual(self.client.get('/orders').data['rows'], [])
+
+
+class CatalogQueryTests(ApiTestCase):
+    """
+    The catalog endpoints join through the model relations: their query count does not
+    depend on the number of rows returned.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.customer = self.create_customer()
+
+    def create_products(self, count):
+        department = Department.objects.create(name='Department')
+        category = Category.objects.create(department=department, name='Category')
+        attribute = Attribute.objects.create(name='Size')
+        products = []
+        for index in range(count):
+            product = self.create_product()
+            ProductCategory.objects.create(product=product, category=category)
+            value = AttributeValue.objects.create(attribute=attribute, value='Size %s' % index)
+            ProductAttribute.objects.create(product=products[0] if products else product, attribute_value=value)
+            Review.objects.create(customer=self.customer, product=products[0] if products else product,
+                                  review='Review %s' % index, rating=5, created_on=timezone.now())
+            products.append(product)
+        return department, category, attribute, products[0]
+
+    def get_data(self, queries, path):
+        cache.clear()
+        catalog_cache.local.clear()
+        with self.assertNumQueries(queries):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_query_counts(self):
+        for count in (2, 20):
+            department, category, attribute, product = self.create_products(count)
+            # COUNT(*) and the page.
+            self.assertEqual(len(self.get_data(2, '/products/inCategory/%s' % category.category_id)['rows']), count)
+            self.assertEqual(len(self.get_data(2, '/products/%s/reviews/' % product.product_id)['rows']), count)
+            self.assertEqual(self.get_data(1, '/categories/inProduct/%s/' % product.product_id)['category_id'],
+                             category.category_id)
+            self.assertEqual(len(self.get_data(1, '/categories/inDepartment/%s/' % department.department_id)['rows']),
+                             1)
+            # exists() and the values.
+            self.assertEqual(len(self.get_data(2, '/attributes/values/%s/' % attribute.attribute_id)), count)
+            self.assertEqual(len(self.get_data(1, '/attributes/inProduct/%s/' % product.product_id)), count)
+
+
+class ProductAttributesTests(ApiTestCase):
+
+    def add_attributes(self, product, attributes, values):
+        for attribute_index in range(attributes):
+            attribute = Attribute.objects.create(name='Attribute %s' % attribute_index)
+            for value_index in range(values):
+                value = AttributeValue.objects.create(attribute=attribute, value='Value %s' % value_index)
+                ProductAttribute.objects.create(product=product, attribute_value=value)
+
+    def test_one_query_regardless_of_attributes(self):
+        for attributes, values in ((1, 1), (3, 5), (10, 10)):
+            product = self.create_product()
+            self.add_attributes(product, attributes, values)
+            catalog_cache.local.clear()
+            cache.clear()
+            with self.assertNumQueries(1):
+                response = self.client.get('/attributes/inProduct/%s/' % product.product_id)
+            self.assertEqual(len(response.data), attributes * values)
+            self.assertEqual(response.data[0], {
+                'attribute_name': 'Attribute 0',
+                'attribute_value_id': response.data[0]['attribute_value_id'],
+                'attribute_value': 'Value 0',
+            })
+
+    def test_unknown_product(self):
+        response = self.client.get('/attributes/inProduct/999/')
+        self.assertEqual(response.data['error']['code'], 'ATTR_01')
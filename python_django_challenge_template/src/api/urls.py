@@ -11,11 +11,12 @@ from api.viewsets.department import DepartmentViewSet
 from api.viewsets.orders import create_order, order, order_details, orders
 from api.viewsets.products import ProductViewSet
 from api.viewsets.shipping_region import ShippingRegionViewSet
-from api.viewsets.shoppingcart import (add_products, empty_cart,
-                                       generate_cart_id, get_products,
-                                       get_saved_products, move_to_cart,
-                                       remove_product, save_for_later,
-                                       total_amount, update_quantity)
+from api.viewsets.shoppingcart import (add_products, add_products_bulk,
+                                       empty_cart, generate_cart_id,
+                                       get_products, get_saved_products,
+                                       move_to_cart, remove_product,
+                                       save_for_later, total_amount,
+                                       update_quantity)
 from api.viewsets.stripe import charge, webhooks
 from api.viewsets.tax import TaxViewSet
 from django.urls import include, path
@@ -42,6 +43,13 @@ urlpatterns = [
     path('products/inCategory/<int:category_id>', ProductViewSet.as_view({"get": "get_products_by_category"})),
     path('products/inDepartment/<int:department_id>', ProductViewSet.as_view({"get": "get_products_by_department"})),
 
+    path('shoppingcart/generateUniqueId', generate_cart_id),
+    path('shoppingcart/add', add_products),
+    path('shoppingcart/add/bulk', add_products_bulk),
+    path('shoppingcart/<str:cart_id>', get_products),
+    path('shoppingcart/totalAmount/<str:cart_id>', total_amount),
+    path('shoppingcart/getSaved/<str:cart_id>', get_saved_products),
+
     path('customer', customer),
     path('customer/update', update_customer),
 
@@ -52,8 +60,11 @@ urlpatterns = [
     path('customers/creditCard', update_credit_card),
 
     # Orders
-    # path('orders', orders),
-    # path('orders/<int:order_id>', order),
-    # path('orders/<int:order_id>/details', order_details),
+    path('orders', orders),
+    path('orders/<int:order_id>', order),
+    path('orders/<int:order_id>/details', order_details),
     path('orders/create', create_order),
+
+    # Stripe
+    path('stripe/webhooks', webhooks),
 ]
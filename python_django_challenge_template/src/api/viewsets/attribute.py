@@ -1,7 +1,9 @@
 import logging
 
 from api import errors
-from api.models import Attribute, AttributeValue, ProductAttribute
+from api.cache import (CachedViewSetMixin, ConditionalGetMixin,
+                       cached_action)
+from api.models import Attribute, AttributeValue
 from api.serializers import (AttributeSerializer,
                              AttributeValueExtendedSerializer,
                              AttributeValueSerializer)
@@ -12,15 +14,25 @@ from rest_framework.response import Response
 logger = logging.getLogger(__name__)
 
 
-class AttributeViewSet(viewsets.ReadOnlyModelViewSet):
+class AttributeViewSet(ConditionalGetMixin, CachedViewSetMixin, viewsets.ReadOnlyModelViewSet):
     """
     list: Return a list of attributes
     retrieve: Return a attribute by ID.
     """
     queryset = Attribute.objects.all()
     serializer_class = AttributeSerializer
+    cache_namespace = 'attribute'
+    cache_timeout = 600
+    conditional_namespaces = ('attribute',)
+    cache_control = {'public': True, 'max_age': 300}
+
+    def get_conditional_namespaces(self):
+        if self.action == 'get_attributes_from_product':
+            return ('attribute', 'product')
+        return self.conditional_namespaces
 
     @action(detail=False, url_path='values/<int:attribute_id>')
+    @cached_action
     def get_values_from_attribute(self, request, *args, **kwargs):
         """
         Get Values Attribute from Attribute ID
@@ -40,13 +52,12 @@ class AttributeViewSet(viewsets.ReadOnlyModelViewSet):
         Get all Attributes with Product ID
         """
         product_id = kwargs.get("product_id")
-        product_attrs = ProductAttribute.objects.filter(product_id=product_id)
+        attribute_values = list(AttributeValue.objects.filter(
+            products=product_id
+        ).select_related('attribute').order_by('attribute__name', 'attribute_value_id'))
 
-        if not product_attrs.exists():
+        if not attribute_values:
             return errors.handle(errors.ATTR_01)
-        
-        value_ids = product_attrs.values_list('attribute_value_id', flat=True)
-        attribute_values = AttributeValue.objects.filter(pk__in = value_ids)
 
         serializer = AttributeValueExtendedSerializer(attribute_values, many=True)
         return Response(serializer.data)
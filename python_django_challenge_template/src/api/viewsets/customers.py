@@ -1,16 +1,18 @@
 import logging
-import re
-from itertools import groupby
 
 from api import errors, serializers
-from api.authentication import UserKeyJWTAuthentication
+from api.authentication import CustomerAccessToken, UserKeyJWTAuthentication
+from api.credit_cards import validate_credit_card
 from api.models import Customer
-from api.serializers import (CreateCustomerSerializer,
+from api.serializers import (CUSTOMER_FIELDS, DEFAULT_CUSTOMER_FIELDS,
+                             CreateCustomerSerializer,
                              CustomerAddressSerializer, CustomerSerializer,
                              SocialSerializer, UpdateCustomerSerializer,
-                             UserSerializer)
+                             UserSerializer, get_sparse_fields)
+from api.social import SOCIAL_LOGIN
 from django.contrib.auth import login
-from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from requests.exceptions import HTTPError
@@ -19,27 +21,41 @@ from rest_framework.decorators import (api_view, authentication_classes,
                                        permission_classes)
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
-from social_core.backends.oauth import BaseOAuth2
 from social_core.exceptions import (AuthForbidden, AuthTokenError,
                                     MissingBackend)
 from social_django.utils import load_backend, load_strategy
 
 logger = logging.getLogger(__name__)
 
+fields_parameter = openapi.Parameter(
+    'fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+    description='Comma separated customer fields to return, e.g. `name,email`. Default: all but `credit_card`.'
+)
 
+
+def get_customer(user, fields):
+    """
+    The customer of `user` with only `fields` loaded from the database, None without one.
+    """
+    if not user.is_authenticated:
+        return None
+    return Customer.objects.only(*fields).filter(user_id=user.pk).first()
+
+
+@swagger_auto_schema(method='GET', manual_parameters=[fields_parameter])
 @api_view(['GET'])
 def customer(request):
     """
     Get a customer by ID. The customer is getting by token
     """
     logger.debug("Getting customer")
-    user = request.user
-    if isinstance(user, AnonymousUser):
+    fields = get_sparse_fields(request, CUSTOMER_FIELDS, DEFAULT_CUSTOMER_FIELDS)
+    customer = get_customer(request.user, fields)
+    if customer is None:
         logger.error(errors.USR_10.message)
         return errors.handle(errors.USR_10)
-    serializer_element = CustomerSerializer(user.customer)
+    serializer_element = CustomerSerializer(customer, fields=fields)
     logger.debug("Success")
     return Response(serializer_element.data)
 
@@ -54,7 +70,7 @@ def update_customer(request):
     # TODO: place the code here
 
 
-@swagger_auto_schema(method="POST", request_body=CreateCustomerSerializer)
+@swagger_auto_schema(method="POST", request_body=CreateCustomerSerializer, manual_parameters=[fields_parameter])
 @api_view(['POST'])
 def create_customer(request):
     """
@@ -64,32 +80,37 @@ def create_customer(request):
     data = request.data
     serializer = CreateCustomerSerializer(data=data)
     serializer.is_valid(raise_exception=True)
+    fields = get_sparse_fields(request, CUSTOMER_FIELDS, DEFAULT_CUSTOMER_FIELDS)
 
     name = serializer.validated_data["name"]
     email = serializer.validated_data["email"]
     password = serializer.validated_data["password"]
 
-    user = User.objects.create_user(
-            username=email,
-            email=email,
-            password=password,
-            first_name=name
-        )
-
-    # Create Customer
-    customer = Customer.objects.create(
-        user=user,
-        name=name,
-        email=email,
-        password=password,
-        shipping_region_id=1  # Default shipping region
-    )
-
-    # Generate JWT
-    refresh = RefreshToken.for_user(user)
-    access_token = str(refresh.access_token)
-
-    customer_data = CustomerSerializer(customer).data
+    # The password is only kept, hashed, by the user: customer.password stays empty.
+    try:
+        with transaction.atomic():
+            user = User.objects.create_user(
+                    username=email,
+                    email=email,
+                    password=password,
+                    first_name=name
+                )
+
+            # Create Customer
+            customer = Customer.objects.create(
+                user=user,
+                name=name,
+                email=email,
+                shipping_region_id=1  # Default shipping region
+            )
+    except IntegrityError:
+        logger.error(errors.USR_04.message)
+        return errors.handle(errors.USR_04)
+
+    # Generate JWT, only the access token is returned
+    access_token = str(CustomerAccessToken.for_user(user, customer_id=customer.customer_id))
+
+    customer_data = CustomerSerializer(customer, fields=fields).data
 
     return Response({
         "customer": customer_data,
@@ -114,26 +135,26 @@ class SocialLoginView(generics.GenericAPIView):
     """Log in using facebook"""
     serializer_class = SocialSerializer
     permission_classes = [permissions.AllowAny]
+    provider = SOCIAL_LOGIN.get('PROVIDER', 'facebook')
 
     def post(self, request):
         logger.debug("Login a customer")
         """Authenticate user through the access_token"""
         serializer = SocialSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        provider = "facebook"
+        fields = get_sparse_fields(request, CUSTOMER_FIELDS, DEFAULT_CUSTOMER_FIELDS)
         strategy = load_strategy(request)
 
         try:
-            backend = load_backend(strategy=strategy, name=provider,
+            backend = load_backend(strategy=strategy, name=self.provider,
                                    redirect_uri=None)
 
         except MissingBackend:
             return Response({'error': 'Please provide a valid provider'},
                             status=status.HTTP_400_BAD_REQUEST)
         try:
-            if isinstance(backend, BaseOAuth2):
-                access_token = serializer.data.get('access_token')
-            user = backend.do_auth(access_token)
+            # One profile request, the pipeline then finds or creates the user.
+            user = backend.do_auth(serializer.data.get('access_token'))
         except HTTPError as error:
             logger.error(str(error))
             return Response({
@@ -142,50 +163,42 @@ class SocialLoginView(generics.GenericAPIView):
                     "details": str(error)
                 }
             }, status=status.HTTP_400_BAD_REQUEST)
-        except AuthTokenError as error:
+        except (AuthTokenError, AuthForbidden) as error:
             logger.error(str(error))
             return Response({
                 "error": "Invalid credentials",
                 "details": str(error)
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            authenticated_user = backend.do_auth(access_token, user=user)
-
-        except HTTPError as error:
-            return Response({
-                "error": "invalid token",
-                "details": str(error)
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        except AuthForbidden as error:
-            return Response({
-                "error": "invalid token",
-                "details": str(error)
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        if authenticated_user and authenticated_user.is_active:
+        if user and user.is_active:
             # generate JWT token
-            login(request, authenticated_user)
-            refresh = RefreshToken.for_user(user)
-
-            try:
-                customer = Customer.objects.get(name=user.first_name + ' ' + user.last_name)
-            except Customer.DoesNotExist:
-                customer = Customer.objects.create(user_id=user.id, name=user.first_name + ' ' + user.last_name,
-                                                   email=user.email)
-
-            serializer_element = CustomerSerializer(customer)
+            login(request, user)
+
+            customer = get_customer(user, fields)
+            if customer is None:
+                customer, _ = Customer.objects.get_or_create(user_id=user.pk, defaults={
+                    'name': user.first_name + ' ' + user.last_name,
+                    'email': user.email,
+                    'shipping_region_id': 1,  # Default shipping region
+                })
+            access = CustomerAccessToken.for_user(user, customer_id=customer.customer_id)
+
+            serializer_element = CustomerSerializer(customer, fields=fields)
             response = Response({
                 'customer': {
                     'schema': serializer_element.data
                 },
-                'accessToken': 'Bearer ' + str(refresh.access_token),
+                'accessToken': 'Bearer ' + str(access),
                 'expires_in': '24h'
             }, 200)
             logger.debug("Success")
             return response
 
+        return Response({
+            "error": "Invalid credentials",
+            "details": "User is inactive"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
 
 @permission_classes((IsAuthenticated,))
 @swagger_auto_schema(method="PUT", request_body=CustomerAddressSerializer)
@@ -197,26 +210,12 @@ def update_address(request):
     # TODO: place the code here
 
 
-def count_consecutive(num):
-    return max(len(list(g)) for _, g in groupby(num))
-
-
-def validate_credit_card(num):
-    logger.debug("Validating credit card")
-    pattern = re.compile(r'(?:\d{4}-){3}\d{4}|\d{16}')
-
-    if not pattern.fullmatch(num) or count_consecutive(num.replace('-', '')) >= 4:
-        return False
-    else:
-        return True
-
-
 @swagger_auto_schema(method='PUT', request_body=openapi.Schema(
     type=openapi.TYPE_OBJECT,
     properties={
         'credit_card': openapi.Schema(type=openapi.TYPE_STRING, description='Credit Card.', required=['true']),
     }
-))
+), manual_parameters=[fields_parameter])
 @api_view(['PUT'])
 def update_credit_card(request):
     """    
@@ -229,16 +228,17 @@ def update_credit_card(request):
             logger.error(errors.USR_08.message)
             return errors.handle(errors.USR_08)
 
+        fields = get_sparse_fields(request, CUSTOMER_FIELDS, DEFAULT_CUSTOMER_FIELDS)
         try:
-            customer = request.user.customer
+            customer = get_customer(request.user, fields)
+            if customer is None:
+                logger.error(errors.USR_10.message)
+                return errors.handle(errors.USR_10)
             customer.credit_card = request.data.get('credit_card', None)
-            customer.save()
-            serializer_element = CustomerSerializer(customer)
+            customer.save(update_fields=['credit_card'])
+            serializer_element = CustomerSerializer(customer, fields=fields)
             logger.debug("Success")
             return Response(serializer_element.data)
-        except AttributeError:
-            logger.error(errors.USR_10.message)
-            return errors.handle(errors.USR_10)
         except Exception as error:
             errors.COM_02.message = str(error)
             logger.error(errors.COM_02.message)
@@ -1,5 +1,6 @@
 from rest_framework import viewsets
 
+from api.cache import CachedViewSetMixin, ConditionalGetMixin
 from api.models import Department
 from api.serializers import DepartmentSerializer
 import logging
@@ -7,10 +8,14 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-class DepartmentViewSet(viewsets.ReadOnlyModelViewSet):
+class DepartmentViewSet(ConditionalGetMixin, CachedViewSetMixin, viewsets.ReadOnlyModelViewSet):
     """
     list: Return a list of departments
     retrieve: Return a department by ID.
     """
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
+    cache_namespace = 'department'
+    cache_timeout = 600
+    conditional_namespaces = ('department',)
+    cache_control = {'public': True, 'max_age': 300}
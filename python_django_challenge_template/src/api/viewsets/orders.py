@@ -1,14 +1,18 @@
 import logging
 
 from api import errors
+from api.audit import ORDER_CREATED, audit
 from api.authentication import UserKeyJWTAuthentication
-from api.models import OrderDetail, Orders
-from api.serializers import (OrdersDetailSerializer, OrdersSaveSerializer,
-                             OrdersSerializer)
+from api.emails import queue_order_email
+from api.models import OrderDetail, OrderRequest, Orders, Shipping, ShoppingCart, Tax
+from api.pagination import OrderSetPagination
+from api.serializers import (OrderItemSerializer, OrdersDetailSerializer,
+                             OrdersSaveSerializer, OrdersSerializer)
 from django.contrib.auth.models import AnonymousUser
-from django.core.mail import EmailMultiAlternatives
+from django.db import connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F
 from django.shortcuts import render
-from django.template.loader import render_to_string
+from django.utils import timezone
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.decorators import (api_view, authentication_classes,
@@ -20,6 +24,62 @@ from turing_backend import settings
 logger = logging.getLogger(__name__)
 
 
+def get_customer_orders(user):
+    """
+    Orders of the customer of `user` with the customer name, as `orders_get_by_customer_id`.
+    """
+    return Orders.objects.filter(customer__user_id=user.pk).select_related('customer').only(
+        'order_id', 'total_amount', 'created_on', 'shipped_on', 'status', 'customer__name'
+    )
+
+
+class EmptyCartError(Exception):
+    pass
+
+
+def create_order_from_cart(cart_id, customer, shipping_id, tax_id):
+    """
+    Convert the buy-now items of a cart into an order in one unit of work, as
+    `shopping_cart_create_order` does: the order details are copied with a single
+    `INSERT ... SELECT`, the total (items, tax and shipping) is computed by the database,
+    the confirmation email is added to the outbox and the cart is emptied. Raises
+    `EmptyCartError` when there is nothing to order.
+    """
+    with transaction.atomic():
+        order = Orders.objects.create(created_on=timezone.now(), customer_id=customer.customer_id,
+                                      shipping_id=shipping_id, tax_id=tax_id, total_amount=0, status=0)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO order_detail (order_id, product_id, attributes, product_name, quantity, unit_cost) "
+                    "SELECT %s, p.product_id, sc.attributes, p.name, sc.quantity, "
+                    "       COALESCE(NULLIF(p.discounted_price, 0), p.price) "
+                    "FROM shopping_cart sc "
+                    "INNER JOIN product p ON sc.product_id = p.product_id "
+                    "WHERE sc.cart_id = %s AND sc.buy_now",
+                    [order.order_id, cart_id]
+                )
+                if cursor.rowcount == 0:
+                    raise EmptyCartError(cart_id)
+
+                cursor.execute(
+                    "UPDATE orders SET total_amount = ROUND("
+                    "  (SELECT SUM(unit_cost * quantity) FROM order_detail WHERE order_id = %s)"
+                    "  * (1 + (SELECT tax_percentage FROM tax WHERE tax_id = %s) / 100)"
+                    "  + (SELECT shipping_cost FROM shipping WHERE shipping_id = %s), 2) "
+                    "WHERE order_id = %s",
+                    [order.order_id, tax_id, shipping_id, order.order_id]
+                )
+            queue_order_email(order, customer)
+        except Exception:
+            # Deleted explicitly as well, MyISAM tables ignore the rollback.
+            OrderDetail.objects.filter(order_id=order.order_id).delete()
+            order.delete()
+            raise
+        ShoppingCart.objects.filter(cart_id=cart_id).delete()
+    return order
+
+
 @swagger_auto_schema(method='POST', request_body=openapi.Schema(
     type=openapi.TYPE_OBJECT,
     properties={
@@ -34,34 +94,118 @@ logger = logging.getLogger(__name__)
 def create_order(request):
     """
     Create a Order
+
+    Send an `Idempotency-Key` header to make retries safe: a key that already created an
+    order returns that order instead of creating another one.
     """
-    # TODO: place the code here
-    return Response({'result':'success'})
+    logger.debug("Creating an order")
+    serializer = OrdersSaveSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    cart_id = serializer.validated_data['cart_id']
+    shipping_id = serializer.validated_data['shipping_id']
+    tax_id = serializer.validated_data['tax_id']
+
+    try:
+        customer = request.user.customer
+    except AttributeError:
+        logger.error(errors.USR_10.message)
+        return errors.handle(errors.USR_10)
+
+    customer_id = customer.customer_id
+    if not Shipping.objects.filter(shipping_id=shipping_id).exists():
+        logger.error(errors.ORD_03.message)
+        return errors.handle(errors.ORD_03)
+    if not Tax.objects.filter(tax_id=tax_id).exists():
+        logger.error(errors.ORD_04.message)
+        return errors.handle(errors.ORD_04)
+
+    order_request = None
+    idempotency_key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+    if idempotency_key:
+        order_request, created = OrderRequest.objects.get_or_create(customer_id=customer_id,
+                                                                    key=idempotency_key[:64])
+        if not created:
+            if order_request.order_id is None:
+                logger.error(errors.ORD_05.message)
+                return errors.handle(errors.ORD_05)
+            logger.debug("Order %s already created for this key", order_request.order_id)
+            return Response({'orderId': order_request.order_id})
+
+    try:
+        order = create_order_from_cart(cart_id, customer, shipping_id, tax_id)
+    except Exception as error:
+        if order_request is not None:
+            order_request.delete()
+        if isinstance(error, EmptyCartError):
+            logger.error(errors.SHP_01.message)
+            return errors.handle(errors.SHP_01)
+        raise
+
+    if order_request is not None:
+        OrderRequest.objects.filter(pk=order_request.pk).update(order_id=order.order_id)
+
+    audit(order.order_id, 'Order created', ORDER_CREATED)
+    logger.debug("Success")
+    return Response({'orderId': order.order_id})
 
 
 @api_view(['GET'])
+@authentication_classes([UserKeyJWTAuthentication])
+@permission_classes([IsAuthenticated])
 def order(request, order_id):
     """
     Get Info about Order
     """
-    # TODO: place the code here
+    # The items of the order, as orders_get_order_details, in one query that also checks
+    # that the order belongs to the customer.
+    subtotal = ExpressionWrapper(F('quantity') * F('unit_cost'), output_field=DecimalField(max_digits=10, decimal_places=2))
+    items = OrderDetail.objects.filter(order_id=order_id, order__customer__user_id=request.user.pk).annotate(
+        subtotal=subtotal
+    ).only('order_id', 'product_id', 'attributes', 'product_name', 'quantity', 'unit_cost').order_by('item_id')
+
+    serializer = OrderItemSerializer(items, many=True)
+    if not serializer.data:
+        logger.error(errors.ORD_01.message)
+        return errors.handle(errors.ORD_01)
+    return Response(serializer.data)
 
 
 @api_view(['GET'])
+@authentication_classes([UserKeyJWTAuthentication])
+@permission_classes([IsAuthenticated])
 def order_details(request, order_id):
     """
     Get Info about Order
     """
     logger.debug("Getting detail info")
-    # TODO: place the code here
+    order = get_customer_orders(request.user).filter(order_id=order_id).first()
+    if order is None:
+        logger.error(errors.ORD_01.message)
+        return errors.handle(errors.ORD_01)
 
+    serializer = OrdersDetailSerializer(order)
+    return Response(serializer.data)
 
+
+@swagger_auto_schema(method='GET', manual_parameters=[
+    openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                      description='Opaque cursor returned in `next`.'),
+    openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                      description='Limit per page, Default: 20.'),
+    openapi.Parameter('count', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+                      description='Set to true to include the total count.'),
+])
 @api_view(['GET'])
+@authentication_classes([UserKeyJWTAuthentication])
+@permission_classes([IsAuthenticated])
 def orders(request):
     """
     Get orders by Customer
     """
-    # TODO: place the code here
+    paginator = OrderSetPagination()
+    page = paginator.paginate_queryset(get_customer_orders(request.user), request)
+    serializer = OrdersDetailSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET'])
@@ -1,7 +1,10 @@
 import logging
 
 from api import errors
-from api.models import Category, Product, ProductCategory, Review
+from api.cache import ConditionalGetMixin
+from api.filters import FullTextSearchFilter
+from api.models import Department, Product, Review
+from api.pagination import ProductSetPagination, ReviewSetPagination
 from api.serializers import (ProductSerializer, ReviewOfProductSerializer,
                              ReviewSerializer)
 from django.contrib.auth.models import AnonymousUser
@@ -10,30 +13,12 @@ from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import viewsets
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
 logger = logging.getLogger(__name__)
 
 
-class ProductSetPagination(PageNumberPagination):
-    page_size = 20
-    page_query_description = 'Inform the page. Starting with 1. Default: 1'
-    page_size_query_param = 'limit'
-    page_size_query_description = 'Limit per page, Default: 20.'
-    max_page_size = 200
-
-    def get_paginated_response(self, data):
-        return Response({
-            'count': self.page.paginator.count,
-            'next': self.get_next_link(),
-            'previous': self.get_previous_link(),
-            'rows': data, # originally 'results': data,
-        })
-
-
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     list: Return a list of products
     retrieve: Return a product by ID.
@@ -41,15 +26,17 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Product.objects.all().order_by('product_id')
     serializer_class = ProductSerializer
     pagination_class = ProductSetPagination
-    filter_backends = (SearchFilter,)
+    filter_backends = (FullTextSearchFilter,)
     search_fields = ('name', 'description')
+    conditional_namespaces = ('product', 'category')
+    cache_control = {'public': True, 'max_age': 60}
+    # Values of Product.display for products shown on department pages.
+    department_display_flags = (2, 3)
 
-    def _get_products_from_category_ids(self, category_ids):
-        product_ids = ProductCategory.objects.filter(
-            category_id__in=category_ids
-        ).values_list("product_id", flat=True)
-
-        return Product.objects.filter(product_id__in=product_ids)
+    def get_conditional_namespaces(self):
+        if self.action == 'reviews':
+            return ('product', 'review')
+        return self.conditional_namespaces
 
     @action(methods=['GET'], detail=False, url_path='search', url_name='Search products')
     def search(self, request, *args, **kwargs):
@@ -63,8 +50,7 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         """
         Get a list of Products by Categories
         """
-
-        products = self._get_products_from_category_ids([category_id])
+        products = Product.objects.filter(categories=category_id).order_by('product_id')
         page = self.paginate_queryset(products)
         if page is not None:
             serializer = ProductSerializer(page, many=True)
@@ -73,20 +59,28 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = ProductSerializer(products, many=True)
         return Response({"rows": serializer.data})
 
+    @swagger_auto_schema(method='GET', manual_parameters=[
+        openapi.Parameter('displayed', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+                          description='Only return products flagged for display on department pages.')
+    ])
     @action(methods=['GET'], detail=False, url_path='inDepartment/(?P<department_id>[^/.]+)')
     def get_products_by_department(self, request, department_id):
         """
         Get a list of Products of Departments
         """
-        department_categories = Category.objects.filter(department_id=department_id)
-        if not department_categories.exists():
-            return errors.handle(errors.DEP_02)
-        
-        category_ids = department_categories.values_list('category_id', flat=True)
+        # One DISTINCT join through product_category and category, as in
+        # catalog_get_products_on_department: the count and the page are the only queries.
+        products = Product.objects.filter(categories__department_id=department_id)
+        if request.query_params.get('displayed', '').lower() in ('1', 'true'):
+            products = products.filter(display__in=self.department_display_flags)
+        products = products.distinct().order_by('product_id')
 
-        products = self._get_products_from_category_ids(category_ids)
         page = self.paginate_queryset(products)
         if page is not None:
+            # An empty page is also a department without (displayed) products or a cursor
+            # past the last page: only then check that the department exists.
+            if not page and not Department.objects.filter(department_id=department_id).exists():
+                return errors.handle(errors.DEP_02)
             serializer = ProductSerializer(page, many=True)
             return self.get_paginated_response(serializer.data)
         
@@ -113,9 +107,11 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         """
         Return a list of reviews
         """
-        reviews = Review.objects.filter(product_id = pk)
-        serializer = ReviewOfProductSerializer(reviews,many=True)
-        return Response(serializer.data)
+        reviews = Review.objects.filter(product_id=pk).select_related('product').order_by('-review_id')
+        paginator = ReviewSetPagination()
+        page = paginator.paginate_queryset(reviews, request, view=self)
+        serializer = ReviewOfProductSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @swagger_auto_schema(method='POST', request_body=openapi.Schema(
         type=openapi.TYPE_OBJECT,
@@ -1,5 +1,6 @@
 from rest_framework import viewsets
 
+from api.cache import CachedViewSetMixin
 from api.models import ShippingRegion
 from api.serializers import ShippingRegionSerializer
 import logging
@@ -7,10 +8,12 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-class ShippingRegionViewSet(viewsets.ReadOnlyModelViewSet):
+class ShippingRegionViewSet(CachedViewSetMixin, viewsets.ReadOnlyModelViewSet):
     """
     list: Get All ShippingRegions
     retrieve: Get ShippingRegion by ID
     """
     queryset = ShippingRegion.objects.all()
     serializer_class = ShippingRegionSerializer
+    cache_namespace = 'shipping_region'
+    cache_timeout = 3600
@@ -1,5 +1,9 @@
+import hashlib
 import uuid
 
+from django.db import IntegrityError, connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
 from django.utils import timezone
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
@@ -9,11 +13,75 @@ from rest_framework.status import HTTP_200_OK
 
 from api import errors
 from api.models import ShoppingCart
-from api.serializers import ShoppingcartSerializer, ProductSerializer
+from api.serializers import (AddProductSerializer, AddProductsSerializer,
+                             CartProductSerializer, CartSavedProductSerializer,
+                             CartTotalSerializer, ProductSerializer,
+                             ShoppingcartSerializer)
 import logging
 
 logger = logging.getLogger(__name__)
 
+# The price a cart item is charged at: the discounted price unless it is zero.
+UNIT_PRICE = Coalesce(NullIf(F('product__discounted_price'), Value(0)), F('product__price'))
+SUBTOTAL = ExpressionWrapper(UNIT_PRICE * F('quantity'), output_field=DecimalField(max_digits=10, decimal_places=2))
+
+
+def get_cart_items(cart_id, buy_now=True):
+    """
+    Cart rows joined with their product, as in `shopping_cart_get_products`.
+    """
+    return ShoppingCart.objects.filter(cart_id=cart_id, buy_now=buy_now).annotate(
+        name=F('product__name'),
+        price=UNIT_PRICE,
+        subtotal=SUBTOTAL,
+    ).values('item_id', 'product_id', 'name', 'attributes', 'price', 'quantity', 'subtotal').order_by('item_id')
+
+
+def attributes_hash(attributes):
+    """
+    Key of the attributes in `idx_shopping_cart_item`, as MySQL's SHA2(attributes, 256).
+    """
+    return hashlib.sha256(attributes.encode('utf-8')).hexdigest()
+
+
+def add_to_cart(cart_id, items):
+    """
+    Add products to a cart, increasing the quantity of the row with the same product and
+    attributes when there is one (and moving it back to the cart, as in
+    `shopping_cart_add_product`). Rows are unique on `idx_shopping_cart_item`
+    (cart, product and attributes hash), so concurrent adds cannot duplicate them.
+
+    On MySQL all the items go in one `INSERT ... ON DUPLICATE KEY UPDATE`. Other databases
+    update the existing row, or insert it and fall back to the update when a concurrent
+    request inserted it first.
+    """
+    now = timezone.now()
+    if connection.vendor == 'mysql':
+        rows = [(cart_id, item['product_id'], item['attributes'], attributes_hash(item['attributes']),
+                 item['quantity'], now) for item in items]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO shopping_cart (cart_id, product_id, attributes, attributes_hash, quantity, buy_now, "
+                "added_on) VALUES " + ", ".join(["(%s, %s, %s, %s, %s, true, %s)"] * len(rows)) + " "
+                "ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity), buy_now = true",
+                [value for row in rows for value in row]
+            )
+        return
+
+    with transaction.atomic():
+        for item in items:
+            key = {'cart_id': cart_id, 'product_id': item['product_id'],
+                   'attributes_hash': attributes_hash(item['attributes'])}
+            increase = {'quantity': F('quantity') + item['quantity'], 'buy_now': True}
+            if ShoppingCart.objects.filter(**key).update(**increase):
+                continue
+            try:
+                with transaction.atomic():
+                    ShoppingCart.objects.create(attributes=item['attributes'], quantity=item['quantity'],
+                                                buy_now=True, added_on=now, **key)
+            except IntegrityError:
+                ShoppingCart.objects.filter(**key).update(**increase)
+
 
 @api_view(['GET'])
 def generate_cart_id(request):
@@ -21,7 +89,7 @@ def generate_cart_id(request):
     Generate the unique CART ID 
     """
     logger.debug("Generating cart ID")
-    return Response({"cart_id": uuid.uuid4()})
+    return Response({"cart_id": uuid.uuid4().hex})
 
 
 @swagger_auto_schema(method='POST', request_body=openapi.Schema(
@@ -37,7 +105,28 @@ def add_products(request):
     """
     Add a Product in the cart
     """
-    # TODO: place the code here
+    logger.debug("Adding product to cart")
+    serializer = AddProductSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    cart_id = serializer.validated_data['cart_id']
+
+    add_to_cart(cart_id, [serializer.validated_data])
+    return Response(CartProductSerializer(get_cart_items(cart_id), many=True).data)
+
+
+@swagger_auto_schema(method='POST', request_body=AddProductsSerializer)
+@api_view(['POST'])
+def add_products_bulk(request):
+    """
+    Add several Products in the cart
+    """
+    logger.debug("Adding products to cart")
+    serializer = AddProductsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    cart_id = serializer.validated_data['cart_id']
+
+    add_to_cart(cart_id, serializer.validated_data['products'])
+    return Response(CartProductSerializer(get_cart_items(cart_id), many=True).data)
 
 
 @api_view(['GET'])
@@ -45,7 +134,9 @@ def get_products(request, cart_id):
     """
     Get List of Products in Shopping Cart
     """
-    # TODO: place the code here
+    logger.debug("Getting products in cart")
+    serializer = CartProductSerializer(get_cart_items(cart_id), many=True)
+    return Response(serializer.data)
 
 
 @swagger_auto_schema(method='PUT', request_body=openapi.Schema(
@@ -92,7 +183,12 @@ def total_amount(request, cart_id):
     """
     Return a total Amount from Cart
     """
-    # TODO: place the code here
+    logger.debug("Getting total amount of cart")
+    total = ShoppingCart.objects.filter(cart_id=cart_id, buy_now=True).aggregate(
+        total_amount=Coalesce(Sum(SUBTOTAL), Value(0), output_field=SUBTOTAL.output_field)
+    )
+    serializer = CartTotalSerializer(total)
+    return Response(serializer.data)
 
 
 @api_view(['GET'])
@@ -108,4 +204,6 @@ def get_saved_products(request, cart_id):
     """
     Get saved Products 
     """
-    # TODO: place the code here
+    logger.debug("Getting saved products in cart")
+    serializer = CartSavedProductSerializer(get_cart_items(cart_id, buy_now=False), many=True)
+    return Response(serializer.data)
@@ -1,11 +1,18 @@
+import json
+import logging
+
+import stripe
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework.decorators import api_view
+from rest_framework.decorators import (api_view, authentication_classes,
+                                       permission_classes)
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
 from api import payments, errors
 from api.payments import PaymentError
-import logging
+from api.webhooks import record_stripe_event
+from turing_backend import settings
 
 logger = logging.getLogger(__name__)
 
@@ -36,8 +43,30 @@ def charge(request):
 
 
 @api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
 def webhooks(request):
     """
     Endpoint that provide a synchronization
+
+    The event is verified and stored, then acknowledged right away: orders are updated
+    later by `manage.py process_stripe_events`. Redelivered events are ignored.
     """
-    # TODO: place the code here
+    secret = settings.WEBHOOK.get('secret')
+    if not secret:
+        logger.error("The Stripe webhook secret is not configured")
+        return errors.handle(errors.STR_01)
+
+    try:
+        # UnicodeDecodeError is a ValueError, an undecodable body is rejected with the rest.
+        payload = request.body.decode('utf-8')
+        stripe.WebhookSignature.verify_header(payload, request.META.get('HTTP_STRIPE_SIGNATURE', ''), secret,
+                                              stripe.Webhook.DEFAULT_TOLERANCE)
+        event = json.loads(payload)
+        event_id, event_type = event['id'], event['type']
+    except (stripe.error.SignatureVerificationError, ValueError, KeyError, TypeError) as e:
+        logger.error("Invalid Stripe webhook: %s", e)
+        return errors.handle(errors.STR_01)
+
+    record_stripe_event(event_id, event_type, payload)
+    return Response({'received': True})
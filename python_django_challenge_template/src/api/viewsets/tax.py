@@ -1,5 +1,6 @@
 from rest_framework import viewsets
 
+from api.cache import CachedViewSetMixin
 from api.models import Tax
 from api.serializers import TaxSerializer
 import logging
@@ -7,10 +8,12 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-class TaxViewSet(viewsets.ReadOnlyModelViewSet):
+class TaxViewSet(CachedViewSetMixin, viewsets.ReadOnlyModelViewSet):
     """
     list: Get All Taxes
     retrieve: Get Tax by ID
     """
     queryset = Tax.objects.all()
     serializer_class = TaxSerializer
+    cache_namespace = 'tax'
+    cache_timeout = 3600
@@ -0,0 +1,129 @@
+import json
+import logging
+from datetime import timedelta
+
+from api.audit import PAYMENT_FAILED, PAYMENT_RECEIVED, write_audit
+from api.models import Orders, StripeEvent
+from django.db import IntegrityError
+from django.db.models import Case, CharField, IntegerField, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# orders.status values set by the charge events.
+ORDER_PAID = 1
+ORDER_PAYMENT_FAILED = 2
+
+# Event type: (order status, audit code, audit message).
+CHARGE_EVENTS = {
+    'charge.succeeded': (ORDER_PAID, PAYMENT_RECEIVED, 'Payment received (charge %(id)s)'),
+    'charge.failed': (ORDER_PAYMENT_FAILED, PAYMENT_FAILED, 'Payment failed (charge %(id)s): %(failure_message)s'),
+}
+
+
+def record_stripe_event(event_id, event_type, payload):
+    """
+    Store a webhook event for `process_stripe_events`. Returns False when the event was
+    already received: Stripe redeliveries hit the unique event id and are dropped.
+    """
+    try:
+        StripeEvent.objects.create(event_id=event_id, type=event_type, payload=payload)
+    except IntegrityError:
+        logger.debug("Stripe event %s already received", event_id)
+        return False
+    return True
+
+
+def claim_stripe_events(batch_size, lease):
+    """
+    Return up to `batch_size` pending events, marked as processing for `lease` seconds.
+    Works as `claim_order_emails`: one conditional UPDATE per row.
+    """
+    now = timezone.now()
+    due = StripeEvent.objects.filter(
+        status__in=(StripeEvent.PENDING, StripeEvent.PROCESSING),
+        next_attempt_on__lte=now
+    ).order_by('id').values_list('id', 'status', 'next_attempt_on')[:batch_size]
+
+    claimed = [
+        pk for pk, status, next_attempt_on in due
+        if StripeEvent.objects.filter(pk=pk, status=status, next_attempt_on=next_attempt_on).update(
+            status=StripeEvent.PROCESSING,
+            next_attempt_on=now + timedelta(seconds=lease)
+        )
+    ]
+    return list(StripeEvent.objects.filter(pk__in=claimed).order_by('id'))
+
+
+def parse_charge_event(event):
+    """
+    Return (created, order_id, charge) of a charge event, `created` being the Stripe
+    creation timestamp of the event.
+    """
+    payload = json.loads(event.payload)
+    charge = payload['data']['object']
+    return int(payload.get('created') or 0), int(charge['metadata']['order_id']), charge
+
+
+def process_stripe_events(batch_size=200, lease=300):
+    """
+    Apply one batch of received events: the orders get their new status and charge
+    reference in a single UPDATE and the audit rows are written with one INSERT. Events of
+    other types are marked as processed, malformed ones and unknown orders as failed.
+    Nothing is marked when a write fails, the batch is retried once its lease expires.
+
+    Stripe does not deliver events in order: the latest event (by `created`) of an order
+    wins, and a paid order is never moved back to failed by a late `charge.failed`.
+    Returns the number of events handled.
+    """
+    events = claim_stripe_events(batch_size, lease)
+    if not events:
+        return 0
+
+    charges, failed, processed = [], {}, []
+    for event in events:
+        if event.type not in CHARGE_EVENTS:
+            processed.append(event.pk)
+            continue
+        try:
+            charges.append((event, *parse_charge_event(event)))
+        except (ValueError, KeyError, TypeError) as error:
+            failed[event.pk] = 'Invalid event: %r' % error
+
+    order_ids = {order_id for _, _, order_id, _ in charges}
+    existing = set(Orders.objects.filter(order_id__in=order_ids).values_list('order_id', flat=True))
+
+    now = timezone.now()
+    updates, audits = {}, []
+    # Oldest first, so the latest event of an order wins, unless the order was paid.
+    for event, _, order_id, charge in sorted(charges, key=lambda item: (item[1], item[0].pk)):
+        if order_id not in existing:
+            failed[event.pk] = "Don't exist order with this ID: %s" % order_id
+            continue
+        status, code, message = CHARGE_EVENTS[event.type]
+        if updates.get(order_id, (None, None))[0] != ORDER_PAID:
+            updates[order_id] = (status, charge.get('id'))
+        audits.append((order_id, message % {'id': charge.get('id'), 'failure_message': charge.get('failure_message')},
+                       code))
+        processed.append(event.pk)
+
+    if updates:
+        # A paid order keeps its status and the reference of the charge that paid it.
+        failures = [order_id for order_id, (status, _) in updates.items() if status != ORDER_PAID]
+        Orders.objects.filter(order_id__in=updates).exclude(order_id__in=failures, status=ORDER_PAID).update(
+            status=Case(*[When(order_id=order_id, then=Value(status))
+                          for order_id, (status, _) in updates.items()], output_field=IntegerField()),
+            reference=Case(*[When(order_id=order_id, then=Value(reference))
+                             for order_id, (_, reference) in updates.items()], output_field=CharField()),
+        )
+        # Raises on failure: the events stay claimed and are processed again after the lease.
+        write_audit(audits)
+
+    StripeEvent.objects.filter(pk__in=processed).update(status=StripeEvent.PROCESSED, processed_on=now,
+                                                        last_error='')
+    for pk, error in failed.items():
+        logger.error("Stripe event %s failed: %s", pk, error)
+        StripeEvent.objects.filter(pk=pk).update(status=StripeEvent.FAILED, last_error=error[:255])
+
+    logger.debug("Processed %s Stripe events, %s failed", len(processed), len(failed))
+    return len(events)
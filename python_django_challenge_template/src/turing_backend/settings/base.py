@@ -14,6 +14,8 @@ import os
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 from datetime import timedelta
 
+from django.core.exceptions import ImproperlyConfigured
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # Quick-start development settings - unsuitable for production
@@ -49,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.audit.AuditMiddleware',
 ]
 
 ROOT_URLCONF = 'turing_backend.urls'
@@ -71,8 +74,50 @@ TEMPLATES = [
     },
 ]
 
+# Templates compiled when the app starts (see api/rendering.py).
+PREWARM_TEMPLATES = ['notify_order.html', 'notify_order.txt']
+
 WSGI_APPLICATION = 'turing_backend.wsgi.application'
 
+# product_category and product_attribute have composite primary keys, their models use the
+# product ForeignKey as primary key, which Django would rather see as a OneToOneField.
+SILENCED_SYSTEM_CHECKS = ['fields.W342']
+
+# Password hashing profile: 'argon2' (needs argon2-cffi), 'bcrypt' (needs bcrypt) or
+# 'pbkdf2', with its cost. The profile hasher hashes new passwords, the others still verify
+# existing hashes. Compare the profiles with `manage.py benchmark_password_hashers`.
+PASSWORD_HASHING = {
+    'PROFILE': os.getenv('PASSWORD_HASHER_PROFILE', 'pbkdf2'),
+    'ARGON2_TIME_COST': 2,
+    'ARGON2_MEMORY_COST': 512,
+    'ARGON2_PARALLELISM': 2,
+    'BCRYPT_ROUNDS': 12,
+    'PBKDF2_ITERATIONS': 150000,
+}
+
+PASSWORD_HASHER_PROFILES = {
+    'argon2': [
+        'api.hashers.TunedArgon2PasswordHasher',
+        'api.hashers.TunedBCryptSHA256PasswordHasher',
+        'api.hashers.TunedPBKDF2PasswordHasher',
+    ],
+    'bcrypt': [
+        'api.hashers.TunedBCryptSHA256PasswordHasher',
+        'api.hashers.TunedArgon2PasswordHasher',
+        'api.hashers.TunedPBKDF2PasswordHasher',
+    ],
+    'pbkdf2': [
+        'api.hashers.TunedPBKDF2PasswordHasher',
+        'api.hashers.TunedArgon2PasswordHasher',
+        'api.hashers.TunedBCryptSHA256PasswordHasher',
+    ],
+}
+if PASSWORD_HASHING['PROFILE'] not in PASSWORD_HASHER_PROFILES:
+    raise ImproperlyConfigured('Unknown PASSWORD_HASHER_PROFILE %r, use one of: %s' % (
+        PASSWORD_HASHING['PROFILE'], ', '.join(sorted(PASSWORD_HASHER_PROFILES))))
+PASSWORD_HASHERS = (PASSWORD_HASHER_PROFILES[PASSWORD_HASHING['PROFILE']]
+                    + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher'])
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -146,7 +191,7 @@ LOGGING = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CustomerJWTAuthentication',
     ),
 
     'DEFAULT_FILTER_BACKENDS': ('django_filters.rest_framework.DjangoFilterBackend',),
@@ -157,6 +202,22 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=50)
 }
 
+# Token-user mode of api/authentication.py: authenticate with the claims of the token
+# instead of loading the user. Revocations reach every worker within LOCAL_TIMEOUT seconds.
+JWT_TOKEN_USER = {
+    'ENABLED': False,
+    'LOCAL_TIMEOUT': 30,
+    'LOCAL_MAX_ENTRIES': 4096,
+}
+
+# Per-worker LRU of validated access tokens (api/authentication.py), entries live until the
+# token expires but at most TIMEOUT seconds.
+JWT_TOKEN_CACHE = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 10000,
+    'TIMEOUT': 3600,
+}
+
 # Facebook configuration
 SOCIAL_AUTH_LOGIN_REDIRECT_URL = '/'
 
@@ -185,9 +246,16 @@ AUTHENTICATION_BACKENDS = (
     'django.contrib.auth.backends.ModelBackend',
     # Facebook OAuth2
     'social_core.backends.facebook.FacebookAppOAuth2',
-    'social_core.backends.facebook.FacebookOAuth2',
+    'api.social.FacebookOAuth2',
 )
 
+# Social login (api/social.py): backend used by /customers/facebook and how long the provider
+# profile of an access token is cached, so a retried login does not call the provider again.
+SOCIAL_LOGIN = {
+    'PROVIDER': 'facebook',
+    'PROFILE_TIMEOUT': 60,
+}
+
 SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': False,
     'SECURITY_DEFINITIONS': {
@@ -199,7 +267,56 @@ SWAGGER_SETTINGS = {
     }
 }
 
+# Read-through cache of the catalog reference tables (see api/cache.py)
+CATALOG_CACHE = {
+    'TIMEOUT': 300,
+    'VERSION_TIMEOUT': 5,
+    'LOCAL_MAX_ENTRIES': 1024,
+}
+
+# Order confirmation outbox, delivered by `manage.py send_order_emails` (see api/emails.py).
+# RETRY_DELAY doubles on every failed attempt, LEASE is how long a worker owns a batch.
+ORDER_EMAIL = {
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 60,
+    'LEASE': 600,
+}
+
+# Payment gateway used by api/payments.py. Timeouts are (connect, read) seconds; the
+# circuit opens after FAILURE_THRESHOLD connection/rate limit errors in a row and lets a
+# trial call through after RESET_TIMEOUT seconds. Use api.payments.FakeGateway in tests.
+PAYMENT_GATEWAY = {
+    'BACKEND': 'api.payments.StripeGateway',
+    'TIMEOUT': (3, 10),
+    'CHARGE_TIMEOUT': (3, 20),
+    'POOL_SIZE': 10,
+    'FAILURE_THRESHOLD': 5,
+    'RESET_TIMEOUT': 30,
+}
+
+# Retries of transient Stripe errors in api/payments.py, with a random delay of up to
+# BASE_DELAY * 2 ** retry seconds (at most MAX_DELAY) between attempts.
+PAYMENT_RETRY = {
+    'MAX_ATTEMPTS': 3,
+    'BASE_DELAY': 0.5,
+    'MAX_DELAY': 4,
+}
+
+# Order audit events are buffered per request/worker thread and written together, at the
+# end of the request or once MAX_SIZE events or MAX_AGE seconds are reached (see api/audit.py).
+# Rows that could not be written are retried with the next flush, up to MAX_PENDING rows.
+AUDIT = {
+    'MAX_SIZE': 100,
+    'MAX_AGE': 5,
+    'MAX_PENDING': 10000,
+}
+
 WEBHOOK = {
     "url": "https://example.com/my/webhook/endpoint",
-    "enabled_events": ['charge.failed', 'charge.succeeded']
+    "enabled_events": ['charge.failed', 'charge.succeeded'],
+    # Signing secret of the endpoint, used to verify the Stripe-Signature header.
+    "secret": os.getenv('STRIPE_WEBHOOK_SECRET'),
+    # Events processed per batch by `manage.py process_stripe_events`.
+    "batch_size": 200,
 }
@@ -13,6 +13,15 @@ CACHES = {
     }
 }
 
+# Keep compiled templates in memory instead of re-reading them from disk on every render.
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
 STRIPE_API_KEY = os.getenv('STRIPE_API_KEY')
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')